@@ -1,12 +1,25 @@
+#!/usr/bin/env python3
 # extract names and birth years from dbpedia data
 
-from rdflib import Graph
-g = Graph()
-g.parse('dbpedia_birth_years.nt', format='nt')
+import argparse
+import json
+
+from make_cgproto import birth_year, parse_year, resource_name
+from ntriples import triples
+
+parser = argparse.ArgumentParser(
+    description='write {resource name: birth year} from a DBpedia dump')
+parser.add_argument('dump', nargs='?',
+                    default='mappingbased-properties_en.nt.bz2')
+parser.add_argument('--output', default='birth_years.json')
+args = parser.parse_args()
 
 date_dict = {}
-for stmt in g.subject_objects(URIRef("http://dbpedia.org/ontology/birthYear")):
-    date_dict[str(stmt[0])[28:]] = stmt[1]
+for subject, _, year in triples(args.dump, (birth_year,)):
+    year = parse_year(year)
+    if year is not None:
+        date_dict[resource_name(subject)] = year
 
-with open('birth_years.json', 'w') as outfile:
+with open(args.output, 'w') as outfile:
     json.dump(date_dict, outfile)
+print(len(date_dict), 'birth years')
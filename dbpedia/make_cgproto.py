@@ -1,22 +1,105 @@
-import networkx as nx
-
-ntriples = open("dbpedia_influences.nt", 'r')
-
-# an influence graph is a directed graph
-g = nx.DiGraph()
-
-# parse the n-triples and add the nodes and edges to our graph
-for ntriple in ntriples:
-    splitup = ntriple.strip('\t\n .').split()
-    node1, node2 = splitup[0].strip('<>'), splitup[2].strip('<>')
-    if not g.has_node(node1):
-        g.add_node(node1)
-    if not g.has_node(node2):
-        g.add_node(node2)
-    if splitup[1] == '<http://dbpedia.org/ontology/influencedBy>':
-        g.add_edge(node2, node1)
-    else:
-        g.add_edge(node1, node2)
-
-# networkx can also write other formats, e.g. GraphML
-nx.write_dot(g, "influences.dot")
+#!/usr/bin/env python3
+"""make the influence graph from DBpedia's mapping-based properties, with
+birth years, in one streaming pass over the (compressed) dump
+
+The graph is written as the same two files the Wikidata pipeline's
+graph_export.py writes, so that layout.py and makengraph.js take either:
+
+    graph_nodes.json    {"ids": [resource name, ...],
+                         "years": [birth year or null, ...],
+                         "linkTypes": ["P737i"]}
+    graph_links.bin     one record per link, from the influencer to the one
+                        they influenced: from and to (int32 indexes into
+                        "ids") then type (uint8, always 0), little-endian,
+                        packed as 9 bytes
+
+Only the influences and birth years are kept while reading, so memory use
+depends on how many of those there are, not on the size of the dump."""
+
+import argparse
+import json
+import struct
+
+from ntriples import triples
+
+resource = 'http://dbpedia.org/resource/'
+ontology = 'http://dbpedia.org/ontology/'
+influenced = ontology + 'influenced'
+influenced_by = ontology + 'influencedBy'
+birth_year = ontology + 'birthYear'
+
+# Wikidata's "influenced" (the inverse of P737, "influenced by"), which is
+# what graph_export.py calls these links
+link_types = ['P737i']
+link_struct = struct.Struct('<iiB')
+
+
+def resource_name(iri):
+    """'http://dbpedia.org/resource/Plato' -> 'Plato'"""
+    if iri.startswith(resource):
+        return iri[len(resource):]
+    return iri
+
+
+def parse_year(text):
+    """a birthYear literal's year, or None if it isn't one"""
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+def read_dump(dump_path):
+    """the influence links, as (influencer, influenced) pairs of resource
+    names, and {resource name: birth year}"""
+    links = set()
+    years = {}
+    bad_years = 0
+    for subject, predicate, obj in triples(
+            dump_path, (influenced, influenced_by, birth_year)):
+        subject = resource_name(subject)
+        if predicate == birth_year:
+            year = parse_year(obj)
+            if year is None:
+                bad_years += 1
+            else:
+                years[subject] = year
+        elif predicate == influenced:
+            links.add((subject, resource_name(obj)))
+        else:
+            links.add((resource_name(obj), subject))
+    if bad_years:
+        print(bad_years, 'birth years could not be read')
+    return links, years
+
+
+def write_graph(links, years, nodes_path='graph_nodes.json',
+                links_path='graph_links.bin'):
+    """write the graph files, returning how many nodes, links and dated
+    nodes there are"""
+    ids = sorted({name for link in links for name in link})
+    index = {name: i for i, name in enumerate(ids)}
+    with open(nodes_path, 'w') as nodesfile:
+        nodesfile.write(json.dumps({'ids': ids,
+                                    'years': [years.get(name) for name in ids],
+                                    'linkTypes': link_types}))
+    with open(links_path, 'wb') as linksfile:
+        for source, target in sorted(links):
+            linksfile.write(link_struct.pack(index[source], index[target], 0))
+    return len(ids), len(links), sum(1 for name in ids if name in years)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dump', nargs='?',
+                        default='mappingbased-properties_en.nt.bz2')
+    parser.add_argument('--nodes', default='graph_nodes.json')
+    parser.add_argument('--links', default='graph_links.bin')
+    args = parser.parse_args()
+
+    links, years = read_dump(args.dump)
+    nodes, link_count, dated = write_graph(links, years, args.nodes,
+                                           args.links)
+    print(nodes, 'nodes,', link_count, 'links,', dated, 'with birth years')
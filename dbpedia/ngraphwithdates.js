@@ -1,22 +1,30 @@
 /*
-A script used to create an ngraph.graph object from a .dot
-of CauseGraph data and annotate it with birth years.
+A script used to create an ngraph.graph object from the graph files
+written by make_cgproto.py and annotate it with birth years.
 */
 
 var fs = require('fs');
-var dot = require('ngraph.fromdot');
+var createGraph = require('ngraph.graph');
 var ser = require('ngraph.serialization/json')
-var birthyears = require('/Users/Shared/causegraph/birth_years.json')
 
-var graphstr = fs.readFileSync('/Users/Shared/causegraph/prototypes/prototype-graphml/influences_shortlabels.dot', 'utf8')
-var graph1 = dot(graphstr)
+// see make_cgproto.py for the format
+var nodes = JSON.parse(fs.readFileSync('graph_nodes.json', 'utf8'))
+var links = fs.readFileSync('graph_links.bin')
+var LINK_SIZE = 9
 
-graph1.forEachNode(function(node){
-    if(node['id'] in birthyears){
-        node.data = birthyears[node['id']]
+var graph1 = createGraph()
+nodes.ids.forEach(function(id, i){
+    if(nodes.years[i] !== null){
+        graph1.addNode(id, nodes.years[i])
     } else {
-        console.log('error with', node['id'])
+        graph1.addNode(id)
+        console.log('no birth year for', id)
 }})
+for (var offset = 0; offset < links.length; offset += LINK_SIZE) {
+    graph1.addLink(nodes.ids[links.readInt32LE(offset)],
+                   nodes.ids[links.readInt32LE(offset + 4)],
+                   {type: nodes.linkTypes[links.readUInt8(offset + 8)]})
+}
 
 graph_json = ser.save(graph1)
 fs.writeFileSync('ngraph_with_dates.json', graph_json, 'utf8')
@@ -0,0 +1,82 @@
+"""streaming N-Triples reader, for DBpedia dumps too big to load into an
+rdflib Graph (or to bzgrep first)
+
+The file is read a line at a time, straight from a .bz2 or .gz if need be,
+and only the lines with a wanted predicate are decoded and parsed, so
+memory use doesn't grow with the size of the file."""
+
+import bz2
+import gzip
+import re
+
+escape_re = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+escapes = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f',
+           '"': '"', "'": "'", '\\': '\\'}
+
+# a literal's value, then its language tag or datatype if it has one
+literal_re = re.compile(r'"((?:[^"\\]|\\.)*)"'
+                        r'(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?$')
+
+
+def replace_escape(match):
+    short, long, char = match.groups()
+    if char is not None:
+        return escapes.get(char, '\\' + char)
+    return chr(int(short or long, 16))
+
+
+def unescape(text):
+    if '\\' not in text:
+        return text
+    return escape_re.sub(replace_escape, text)
+
+
+def parse_term(text):
+    """an IRI or literal's value (literals lose their language tag or
+    datatype), or a blank node's label with its _: """
+    if text.startswith('<') and text.endswith('>'):
+        return unescape(text[1:-1])
+    if text.startswith('_:'):
+        return text
+    match = literal_re.match(text)
+    if match:
+        return unescape(match.group(1))
+    raise ValueError('not an N-Triples term: ' + text)
+
+
+def open_triples(path):
+    """open an N-Triples file for reading bytes, decompressing it on the fly
+    if it ends with .bz2 or .gz"""
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def triples(path, predicates=None):
+    """yield (subject, predicate, object) for every triple in the file, or
+    only those whose predicate is one of `predicates` (full IRIs)"""
+    wanted = None
+    if predicates is not None:
+        wanted = {('<%s>' % predicate).encode() for predicate in predicates}
+    with open_triples(path) as infile:
+        for number, line in enumerate(infile, 1):
+            # subjects and predicates never contain whitespace, so the
+            # predicate can be checked before anything is decoded
+            parts = line.split(None, 2)
+            if len(parts) < 3 or parts[0].startswith(b'#'):
+                continue
+            subject, predicate, rest = parts
+            if wanted is not None and predicate not in wanted:
+                continue
+            rest = rest.rstrip()
+            if not rest.endswith(b'.'):
+                raise ValueError('line %d: no . at the end' % number)
+            try:
+                triple = (parse_term(subject.decode('utf-8')),
+                          parse_term(predicate.decode('utf-8')),
+                          parse_term(rest[:-1].rstrip().decode('utf-8')))
+            except ValueError as e:
+                raise ValueError('line %d: %s' % (number, e))
+            yield triple
@@ -1,8 +1,16 @@
 fs = require('fs')
-dot = require('ngraph.fromdot')
+createGraph = require('ngraph.graph')
 createLayout = require('ngraph.offline.layout')
 save = require('ngraph.tobinary')
 
-graphstr = fs.readFileSync('opentree.dot', 'utf-8')
-graph = dot(graphstr)
+// written by opentree_extract.py; see there for the format
+names = fs.readFileSync('opentree_nodes.txt', 'utf-8').split('\n')
+links = fs.readFileSync('opentree_links.bin')
+LINK_SIZE = 8
+
+graph = createGraph()
+for (offset = 0; offset < links.length; offset += LINK_SIZE) {
+    graph.addLink(names[links.readInt32LE(offset)],
+                  names[links.readInt32LE(offset + 4)])
+}
 save(graph)
@@ -0,0 +1,131 @@
+"""streaming Newick parser, for trees too big to load whole (like OpenTree's
+multi-million-tip supertree)
+
+The file is read in chunks and split into tokens with one regex, and the
+parser only keeps the chain of clades that are still open, so memory use
+grows with the depth of the tree rather than its size.  Nodes are numbered
+in post-order (children before their parent), which is the order in which
+their names become known."""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import re
+import sys
+from array import array
+
+CHUNK_SIZE = 1 << 22
+
+# quoted labels (with '' for a quote), bare labels, punctuation and
+# [comments]; the \Z alternatives catch a quote or comment cut off by the
+# end of a chunk, so that it gets held back and finished with the next one
+token_re = re.compile(r"""'(?:[^']|'')*'(?!')|'[\s\S]*\Z|
+                          \[[^\]]*\]|\[[^\]]*\Z|
+                          [(),:;]|
+                          [^\s(),:;\[\]']+""", re.VERBOSE)
+
+
+def tokenize(infile, chunk_size=CHUNK_SIZE):
+    """yield the tokens of a Newick text file: '(', ')', ',', ':', ';', and
+    labels (quoted ones unquoted); comments are dropped"""
+    leftover = ''
+    while True:
+        chunk = infile.read(chunk_size)
+        text = leftover + chunk
+        leftover = ''
+        for match in token_re.finditer(text):
+            # a token that runs up to the end may continue in the next chunk
+            if chunk and match.end() == len(text):
+                leftover = text[match.start():]
+                break
+            token = match.group()
+            if token.startswith('['):
+                continue
+            if token.startswith("'"):
+                yield 'label', token[1:-1].replace("''", "'")
+            elif token in '(),:;':
+                yield token, None
+            else:
+                yield 'label', token
+        if not chunk:
+            break
+
+
+def parse(tokens):
+    """yield (node, name, children) for every node of the tree(s), in
+    post-order, where node is its number and children a list of its
+    children's numbers; branch lengths are skipped"""
+    # the children found so far of each clade that is still open
+    open_clades = []
+    # the children of a clade that has just been closed, until its name
+    closed = None
+    # whether a node starts here (after '(', ',' or the end of a tree), so
+    # that a ',', ')', ':' or ';' means it has no name
+    expect_node = True
+    in_length = False
+    count = 0
+    for kind, value in tokens:
+        if kind == 'label' and in_length:
+            in_length = False
+            continue
+        node = None
+        if closed is not None:
+            node = (value if kind == 'label' else '', closed)
+            closed = None
+        elif kind == 'label':
+            node = (value, [])
+        elif expect_node and kind in (',', ')', ':', ';'):
+            node = ('', [])
+        if node is not None:
+            yield count, node[0], node[1]
+            if open_clades:
+                open_clades[-1].append(count)
+            count += 1
+
+        expect_node = kind in ('(', ',', ';')
+        in_length = kind == ':'
+        if kind == '(':
+            open_clades.append([])
+        elif kind == ')':
+            if not open_clades:
+                raise ValueError('unbalanced parentheses in the tree')
+            closed = open_clades.pop()
+        elif kind == ';' and open_clades:
+            raise ValueError('unbalanced parentheses in the tree')
+
+
+def read_tree(path, chunk_size=CHUNK_SIZE):
+    """parse(tokenize()) of a Newick file"""
+    with io.open(path, encoding='utf-8') as infile:
+        for node in parse(tokenize(infile, chunk_size)):
+            yield node
+
+
+class EdgeWriter:
+    """write (parent, child) node numbers as little-endian int32 pairs, a
+    block at a time"""
+
+    def __init__(self, path, block_size=1 << 20):
+        self.outfile = open(path, 'wb')
+        self.block_size = block_size
+        self.block = array('i')
+        self.count = 0
+
+    def add(self, parent, children):
+        for child in children:
+            self.block.append(parent)
+            self.block.append(child)
+        self.count += len(children)
+        if len(self.block) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if sys.byteorder == 'big':
+            self.block.byteswap()
+        self.outfile.write(self.block.tobytes())
+        del self.block[:]
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
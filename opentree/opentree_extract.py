@@ -0,0 +1,155 @@
+#!/usr/bin/python
+"""extract the graph and the labels from the OpenTree supertree with names,
+in one streaming pass over it
+
+The node names (like 'Homo sapiens ott770315', 'Homo_sapiens_ott770315'
+or 'mrcaott1ott2') are split into an OTT id and a readable label in
+batches, across a pool of worker processes, while the tree is read.  The
+outputs are:
+
+    opentree_nodes.txt    each node's OTT id (or mrcaott... name, or
+                          failing that its name or 'node<number>'), one
+                          per line, in the order the nodes are numbered
+    opentree_links.bin    a (parent, child) pair of little-endian int32
+                          node numbers for every edge, for makengraph.js
+    full_labels.json      {OTT id: label}
+    opentree_report.json  names that couldn't be made sense of, counted
+                          by problem, with some examples of each"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import io
+import json
+import multiprocessing
+import re
+
+from newick import EdgeWriter, read_tree
+
+default_tree = ('opentree9.1_tree/labelled_supertree/'
+                'labelled_supertree_ottnames.tre')
+
+batch_size = 50000
+max_examples = 20
+
+# a taxon name (spaces or underscores between words) and its OTT id, or
+# the "most recent common ancestor" of two taxa
+taxon_name = re.compile(r'^(?:(.*?)[ _]+)?ott(\d+)$')
+mrca_name = re.compile(r'^mrcaott(\d+)ott(\d+)$')
+
+
+def classify(name):
+    """(OTT id, label, problem) for a node name, where the OTT id is None
+    if there isn't one, and problem is None if the name made sense"""
+    match = mrca_name.match(name)
+    if match:
+        return name, 'mrca - %s - %s' % match.groups(), None
+    match = taxon_name.match(name)
+    if match:
+        words, number = match.groups()
+        if not words:
+            return 'ott' + number, 'ott' + number, 'no taxon name'
+        return 'ott' + number, '%s - %s' % (words.replace('_', ' '),
+                                            number), None
+    return None, name, 'no OTT id' if name else 'no name'
+
+
+def classify_batch(names):
+    return [classify(name) for name in names]
+
+
+def batches(tree_path, edges):
+    """the node names of a tree, in batches, writing its edges as they're
+    found"""
+    names = []
+    for node, name, children in read_tree(tree_path):
+        names.append(name)
+        edges.add(node, children)
+        if len(names) >= batch_size:
+            yield names
+            names = []
+    if names:
+        yield names
+
+
+# a copy of wikidata/dump_reader.py's bounded_imap(), as opentree/ is
+# deployed on its own; a fix to either belongs in both
+def bounded_imap(pool, func, tasks, ahead):
+    """like pool.imap, but only pulls `ahead` tasks from the iterable at a
+    time, so a fast reader can't queue the whole tree in memory"""
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= ahead:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def extract(tree_path, nodes_path, links_path, labels_path, workers=1):
+    """write the graph and labels, returning the diagnostics report"""
+    edges = EdgeWriter(links_path)
+    problems = {}
+    nodes = labels = 0
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        tasks = batches(tree_path, edges)
+        if pool is None:
+            results = map(classify_batch, tasks)
+        else:
+            results = bounded_imap(pool, classify_batch, tasks, workers * 2)
+        with io.open(nodes_path, 'w', encoding='utf-8') as nodesfile, \
+                io.open(labels_path, 'w', encoding='utf-8') as labelsfile:
+            labelsfile.write('{')
+            for batch in results:
+                for ott_id, label, problem in batch:
+                    if problem is not None:
+                        found = problems.setdefault(
+                            problem, {'count': 0, 'examples': []})
+                        found['count'] += 1
+                        if len(found['examples']) < max_examples:
+                            found['examples'].append(label or nodes)
+                    # the graph needs an id for every node, even those
+                    # whose name isn't one
+                    nodesfile.write((ott_id or label or 'node%d' % nodes) +
+                                    '\n')
+                    nodes += 1
+                    if ott_id is None:
+                        continue
+                    labelsfile.write('%s%s: %s' % (', ' if labels else '',
+                                                  json.dumps(ott_id),
+                                                  json.dumps(label)))
+                    labels += 1
+            labelsfile.write('}')
+    finally:
+        if pool is not None:
+            pool.terminate()
+    edges.close()
+    return {'nodes': nodes, 'edges': edges.count, 'labels': labels,
+            'problems': problems}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('tree', nargs='?', default=default_tree)
+    parser.add_argument('--nodes', default='opentree_nodes.txt')
+    parser.add_argument('--links', default='opentree_links.bin')
+    parser.add_argument('--labels', default='full_labels.json')
+    parser.add_argument('--report', default='opentree_report.json')
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='processes to classify the node names with')
+    args = parser.parse_args()
+
+    report = extract(args.tree, args.nodes, args.links, args.labels,
+                     args.workers)
+    with open(args.report, 'w') as reportfile:
+        reportfile.write(json.dumps(report, indent=1))
+    print(report['nodes'], 'nodes,', report['edges'], 'edges,',
+          report['labels'], 'labels;',
+          {problem: found['count']
+           for problem, found in report['problems'].items()})
@@ -0,0 +1,344 @@
+"""load the graph into ArangoDB through its HTTP bulk import API, straight
+from the pipeline's in-memory data (no TSVs or arangoimp in between)
+
+Documents are sent as JSON lines in large batches, by a pool of threads
+that each keep a connection open.  Every batch is imported with
+onDuplicate=replace, so loading the same data twice changes nothing.
+
+With a manifest directory, a load is a delta against the last one: a
+64-bit hash of each document's key and of the document itself is kept
+there, documents whose hash hasn't changed aren't sent again, and those
+that are gone since the last load are removed.  The manifest is only
+replaced once a load has finished, so a failed load is simply repeated."""
+
+import base64
+import collections
+import hashlib
+import http.client
+import json
+import os
+import queue
+import time
+import urllib.parse
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from edges import int_to_entity, props
+
+default_url = 'http://localhost:8529'
+nodes_collection = 'items'
+edges_collection = 'relations'
+
+# what an import response counts, in the run's stats
+import_counts = ('created', 'updated', 'ignored', 'empty', 'errors')
+# "document not found", when removing one that's already gone
+not_found = 1202
+
+
+def hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(),
+                          'little')
+
+
+class ArangoClient:
+    """a minimal ArangoDB HTTP client for one database, with a pool of
+    keep-alive connections that can be shared between threads"""
+
+    def __init__(self, base_url=default_url, database='_system', user=None,
+                 password='', pool_size=4, retries=3, timeout=600):
+        url = urllib.parse.urlsplit(base_url)
+        self.connection_class = (http.client.HTTPSConnection
+                                 if url.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.host, self.port = url.hostname, url.port
+        self.prefix = (url.path.rstrip('/') + '/_db/' +
+                       urllib.parse.quote(database))
+        self.headers = {'Content-Type': 'application/json'}
+        if user:
+            credentials = ('%s:%s' % (user, password)).encode()
+            self.headers['Authorization'] = (
+                'Basic ' + base64.b64encode(credentials).decode())
+        self.retries = retries
+        self.timeout = timeout
+        # connections are only opened when first needed
+        self.connections = queue.LifoQueue()
+        for _ in range(pool_size):
+            self.connections.put(None)
+
+    def request(self, method, path, body=None, params=None):
+        """(HTTP status, decoded JSON response) of a request, retrying
+        dropped connections and server errors with a growing delay"""
+        url = self.prefix + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        connection = self.connections.get()
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(2 ** (attempt - 1))
+                try:
+                    if connection is None:
+                        connection = self.connection_class(
+                            self.host, self.port, timeout=self.timeout)
+                    connection.request(method, url, body, self.headers)
+                    response = connection.getresponse()
+                    data = response.read()
+                except (http.client.HTTPException, OSError) as e:
+                    error = e
+                    if connection is not None:
+                        connection.close()
+                    connection = None
+                    continue
+                if response.status < 500:
+                    return response.status, json.loads(data or 'null')
+                error = RuntimeError('%s %s: HTTP %d: %s' % (
+                    method, path, response.status, data[:200]))
+            raise error
+        finally:
+            self.connections.put(connection)
+
+    def check(self, method, path, body=None, params=None, allow=()):
+        """request(), raising RuntimeError with ArangoDB's message if it
+        failed with a status not in `allow`"""
+        status, result = self.request(method, path, body, params)
+        if status >= 400 and status not in allow:
+            message = isinstance(result, dict) and result.get('errorMessage')
+            raise RuntimeError('%s %s: HTTP %d: %s' % (method, path, status,
+                                                       message or result))
+        return status, result
+
+    def create_collection(self, name, edge=False):
+        """create a collection, unless it exists already (409)"""
+        self.check('POST', '/_api/collection',
+                   json.dumps({'name': name, 'type': 3 if edge else 2}),
+                   allow=(409,))
+
+    def import_documents(self, collection, body):
+        """bulk import JSON lines, replacing documents with the same keys,
+        returning the import counts"""
+        _, result = self.check('POST', '/_api/import', body, {
+            'collection': collection, 'type': 'documents',
+            'onDuplicate': 'replace', 'details': 'true'})
+        if result.get('errors'):
+            raise RuntimeError('importing into %s: %d errors, e.g. %s' % (
+                collection, result['errors'], result.get('details', [])[:3]))
+        return collections.Counter({count: result.get(count, 0)
+                                    for count in import_counts})
+
+    def remove_documents(self, collection, keys):
+        """remove documents by key, returning how many there were"""
+        _, results = self.check(
+            'DELETE', '/_api/document/' + urllib.parse.quote(collection),
+            json.dumps(keys))
+        failed = [result for result in results if result.get('error') and
+                  result.get('errorNum') != not_found]
+        if failed:
+            raise RuntimeError('removing from %s: %d errors, e.g. %s' % (
+                collection, len(failed), failed[:3]))
+        return sum(1 for result in results if not result.get('error'))
+
+
+class Manifest:
+    """the key and document hashes of the last load of a collection, in
+    <collection>.npy, with the keys themselves in <collection>.keys (one a
+    line, in the same order) so that documents that have gone can be
+    removed"""
+
+    hash_dtype = np.dtype([('key', '<u8'), ('doc', '<u8')])
+
+    def __init__(self, directory, collection):
+        self.path = os.path.join(directory, collection)
+        try:
+            hashes = np.load(self.path + '.npy')
+        except FileNotFoundError:
+            hashes = np.zeros(0, dtype=self.hash_dtype)
+        self.hashes = hashes
+        self.order = np.argsort(hashes['key'], kind='stable')
+        self.sorted_keys = hashes['key'][self.order]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def unchanged(self, key_hashes, doc_hashes):
+        """a mask of which documents were loaded last time as they are"""
+        if not len(self):
+            return np.zeros(len(key_hashes), dtype=bool)
+        pos = np.searchsorted(self.sorted_keys, key_hashes)
+        pos[pos == len(self)] = 0
+        found = self.order[pos]
+        return ((self.hashes['key'][found] == key_hashes) &
+                (self.hashes['doc'][found] == doc_hashes))
+
+    def removed(self, key_hashes):
+        """yield the keys that were loaded last time but aren't among
+        `key_hashes` now"""
+        gone = ~np.isin(self.hashes['key'], key_hashes)
+        if not gone.any():
+            return
+        with open(self.path + '.keys', encoding='utf-8') as keysfile:
+            for key, is_gone in zip(keysfile, gone.tolist()):
+                if is_gone:
+                    yield key.rstrip('\n')
+
+
+class ManifestWriter:
+    """write a new manifest as documents are loaded, to take the old one's
+    place with commit()"""
+
+    def __init__(self, directory, collection):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, collection)
+        self.keysfile = open(self.path + '.keys.new', 'w', encoding='utf-8')
+        self.key_hashes = array('Q')
+        self.doc_hashes = array('Q')
+
+    def add(self, keys, key_hashes, doc_hashes):
+        self.keysfile.writelines(key + '\n' for key in keys)
+        self.key_hashes.extend(key_hashes)
+        self.doc_hashes.extend(doc_hashes)
+
+    def commit(self):
+        self.keysfile.close()
+        hashes = np.empty(len(self.key_hashes), dtype=Manifest.hash_dtype)
+        hashes['key'] = np.frombuffer(self.key_hashes, dtype='<u8')
+        hashes['doc'] = np.frombuffer(self.doc_hashes, dtype='<u8')
+        with open(self.path + '.npy.new', 'wb') as hashesfile:
+            np.save(hashesfile, hashes)
+        # the hashes go last, as they decide what the next load skips
+        os.replace(self.path + '.keys.new', self.path + '.keys')
+        os.replace(self.path + '.npy.new', self.path + '.npy')
+
+    def abort(self):
+        self.keysfile.close()
+        os.remove(self.path + '.keys.new')
+
+
+class ArangoLoader:
+    """load collections of documents (dicts with a _key) into ArangoDB, in
+    batches of `batch_size` across `workers` threads, as a delta against
+    the manifests in `manifest_dir` if given"""
+
+    def __init__(self, base_url=default_url, database='_system', user=None,
+                 password='', workers=4, batch_size=10000, manifest_dir=None,
+                 retries=3):
+        self.client = ArangoClient(base_url, database, user, password,
+                                   pool_size=workers, retries=retries)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.manifest_dir = manifest_dir
+
+    def batches(self, documents, manifest, writer, stats):
+        """the documents as JSON lines bodies, leaving out those the
+        manifest has unchanged"""
+        keys, lines = [], []
+        for document in documents:
+            keys.append(document['_key'])
+            lines.append(json.dumps(document, separators=(',', ':'),
+                                    ensure_ascii=False).encode())
+            if len(lines) >= self.batch_size:
+                body = self.delta(keys, lines, manifest, writer, stats)
+                if body:
+                    yield body
+                keys, lines = [], []
+        body = self.delta(keys, lines, manifest, writer, stats)
+        if body:
+            yield body
+
+    def delta(self, keys, lines, manifest, writer, stats):
+        stats['documents'] += len(lines)
+        if manifest is None:
+            return b'\n'.join(lines)
+        key_hashes = np.fromiter((hash64(key.encode()) for key in keys),
+                                 dtype='<u8', count=len(keys))
+        doc_hashes = np.fromiter(map(hash64, lines), dtype='<u8',
+                                 count=len(lines))
+        writer.add(keys, key_hashes, doc_hashes)
+        unchanged = manifest.unchanged(key_hashes, doc_hashes)
+        stats['unchanged'] += int(unchanged.sum())
+        return b'\n'.join(line for line, same in
+                          zip(lines, unchanged.tolist()) if not same)
+
+    def load(self, collection, documents, edge=False):
+        """load a collection, returning counts of what happened"""
+        stats = collections.Counter(dict.fromkeys(
+            ('documents', 'unchanged', 'removed') + import_counts, 0))
+        manifest = writer = None
+        if self.manifest_dir:
+            manifest = Manifest(self.manifest_dir, collection)
+            writer = ManifestWriter(self.manifest_dir, collection)
+        try:
+            bodies = self.batches(documents, manifest, writer, stats)
+            with ThreadPoolExecutor(self.workers) as pool:
+                # only a few batches are queued at once, so the documents
+                # aren't all serialised ahead of the imports
+                pending = collections.deque()
+                for number, body in enumerate(bodies):
+                    if not number:
+                        # only now that there's something to send, so that
+                        # an unchanged delta makes no requests at all
+                        self.client.create_collection(collection, edge)
+                    pending.append(pool.submit(self.client.import_documents,
+                                               collection, body))
+                    if len(pending) >= self.workers * 2:
+                        stats.update(pending.popleft().result())
+                while pending:
+                    stats.update(pending.popleft().result())
+                if manifest is not None:
+                    removed = manifest.removed(
+                        np.frombuffer(writer.key_hashes, dtype='<u8'))
+                    for count in pool.map(
+                            lambda keys: self.client.remove_documents(
+                                collection, keys),
+                            chunks(removed, self.batch_size)):
+                        stats['removed'] += count
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+        if writer is not None:
+            writer.commit()
+        return dict(stats)
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def node_documents(nodes, labels, years):
+    """the graph's nodes, with the same fields as write_arangodb_nodes()
+    gives them"""
+    for node in nodes:
+        # TODO stop hardcoding "Article"; use "instance of" or something
+        yield {'_key': node, 'name': labels[node] if node in labels else node,
+               'label': 'Article', 'date': years.get(node)}
+
+
+def edge_documents(statements, nodes=nodes_collection):
+    """the final statements as edges, keyed by their ends and property"""
+    for src, code, dst in zip(statements['src'].tolist(),
+                              statements['prop'].tolist(),
+                              statements['dst'].tolist()):
+        src, dst, prop = int_to_entity(src), int_to_entity(dst), props[code]
+        yield {'_key': '%s-%s-%s' % (src, prop, dst),
+               '_from': nodes + '/' + src, '_to': nodes + '/' + dst,
+               'type': prop}
+
+
+def load_graph(loader, nodes, labels, years, statements):
+    """load the nodes into `nodes_collection` and the statements into
+    `edges_collection`, returning the counts for each"""
+    return {
+        nodes_collection: loader.load(
+            nodes_collection, node_documents(nodes, labels, years)),
+        edges_collection: loader.load(
+            edges_collection, edge_documents(statements), edge=True),
+    }
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""columnar binary artifacts that the pipeline's tools can memory-map
+
+A run writes a directory (cg_data/ by default) holding:
+
+    edges.npy               final statements, as edges.edge_dtype records
+    years_qids.npy          sorted entity ints of the graph's dated nodes
+    years.npy               their years
+    labels_qids.npy         sorted entity ints of the labelled entities:
+                            every one with --labels all, only the graph's
+                            nodes (and the filter's classes) with --labels
+                            graph
+    labels_offsets.npy      where each label starts in labels.bin (+ the end)
+    labels.bin              the labels, UTF-8, back to back
+    dates_qids.npy          entity int of every date claim, in QID order
+    dates_props.npy         index of its property into dates_props.json
+    dates.npy               its date, packed (see dates.py)
+
+Everything is loaded with mmap, so opening the artifacts takes no time and
+only the pages that are actually looked at get read (see label_store.py
+for looking labels up).  Run this script to export them as JSON."""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from dates import date_dtype, date_prop_codes, date_props, format_date
+from edges import entity_to_int, int_to_entity, is_encodable
+
+default_dir = 'cg_data'
+
+
+def write_string_heap(directory, name, strings):
+    """write strings back to back, with an offsets index next to them"""
+    offsets = np.empty(len(strings) + 1, dtype='<i8')
+    offsets[0] = 0
+    position = 0
+    with open(os.path.join(directory, name + '.bin'), 'wb') as heapfile:
+        for i, string in enumerate(strings):
+            data = string.encode()
+            heapfile.write(data)
+            position += len(data)
+            offsets[i + 1] = position
+    np.save(os.path.join(directory, name + '_offsets.npy'), offsets)
+
+
+class StringHeap:
+    """read-only view of a heap written by write_string_heap()"""
+
+    def __init__(self, directory, name):
+        self.offsets = np.load(os.path.join(directory, name + '_offsets.npy'),
+                               mmap_mode='r')
+        heap_path = os.path.join(directory, name + '.bin')
+        if os.path.getsize(heap_path):
+            self.heap = np.memmap(heap_path, dtype='u1', mode='r')
+        else:
+            self.heap = np.zeros(0, dtype='u1')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.heap[start:end].tobytes().decode()
+
+
+def write_labels(directory, labels):
+    qids = np.fromiter((entity_to_int(qid) for qid in labels
+                        if is_encodable(qid)), dtype='<i8')
+    qids.sort()
+    np.save(os.path.join(directory, 'labels_qids.npy'), qids)
+    write_string_heap(directory, 'labels',
+                      [labels[int_to_entity(qid)] for qid in qids.tolist()])
+
+
+def write_date_claims(directory, dates):
+    # a stable sort keeps each item's claims in the order they were found
+    dates = dates[np.argsort(dates['qid'], kind='stable')]
+    np.save(os.path.join(directory, 'dates_qids.npy'), dates['qid'])
+    np.save(os.path.join(directory, 'dates_props.npy'), dates['prop'])
+    np.save(os.path.join(directory, 'dates.npy'), dates['date'])
+    with open(os.path.join(directory, 'dates_props.json'), 'w') as propfile:
+        propfile.write(json.dumps(date_props))
+
+
+def write_artifacts(directory, edges, years, labels, dates):
+    """write the final edges, the year table of the graph's nodes, the
+    labels kept by the scan and all date claims (as dates.date_dtype
+    records)"""
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, 'edges.npy'), edges)
+    years_qids, years_values = years
+    np.save(os.path.join(directory, 'years_qids.npy'), years_qids)
+    np.save(os.path.join(directory, 'years.npy'), years_values)
+    write_labels(directory, labels)
+    write_date_claims(directory, dates)
+
+
+class Artifacts:
+    """memory-mapped access to a directory written by write_artifacts()"""
+
+    def __init__(self, directory=default_dir):
+        self.directory = directory
+        self.edges = self.load('edges.npy')
+        self.years = (self.load('years_qids.npy'), self.load('years.npy'))
+        self.labels_qids = self.load('labels_qids.npy')
+        self.labels = StringHeap(directory, 'labels')
+
+    def load(self, name):
+        return np.load(os.path.join(self.directory, name), mmap_mode='r')
+
+    def iter_labels(self):
+        for i, number in enumerate(self.labels_qids.tolist()):
+            yield int_to_entity(number), self.labels[i]
+
+    def iter_years(self):
+        qids, values = self.years
+        return zip(map(int_to_entity, qids.tolist()), values.tolist())
+
+    def load_dates(self):
+        """all date claims, as dates.date_dtype records"""
+        with open(os.path.join(self.directory, 'dates_props.json')) as pfile:
+            props = json.loads(pfile.read())
+        # dates_props.json is there in case the properties ever change
+        codes = np.array([date_prop_codes[prop] for prop in props],
+                         dtype='<u2')
+        qids = self.load('dates_qids.npy')
+        dates = np.empty(len(qids), dtype=date_dtype)
+        dates['qid'] = qids
+        dates['prop'] = codes[self.load('dates_props.npy')]
+        dates['date'] = self.load('dates.npy')
+        return dates
+
+    def iter_date_claims(self):
+        """yield (QID, property, date string) for every date claim"""
+        dates = self.load_dates()
+        for number, prop, date in zip(dates['qid'].tolist(),
+                                      dates['prop'].tolist(),
+                                      dates['date'].tolist()):
+            yield int_to_entity(number), date_props[prop], format_date(date)
+
+
+def export_json(artifacts, years_path=None, labels_path=None,
+                dates_path=None):
+    """write wd_years.json, wd_labels.json and/or date_claims.json, in the
+    same form wd2cg.py used to write them"""
+    if years_path:
+        with open(years_path, 'w') as outfile:
+            outfile.write(json.dumps(dict(artifacts.iter_years()),
+                                     indent=True))
+    if labels_path:
+        with open(labels_path, 'w') as outfile:
+            outfile.write(json.dumps(dict(artifacts.iter_labels()),
+                                     indent=True))
+    if dates_path:
+        date_claims = {}
+        for qid, prop, date in artifacts.iter_date_claims():
+            date_claims.setdefault(qid, []).append([prop, date])
+        with open(dates_path, 'w') as outfile:
+            outfile.write(json.dumps(date_claims, indent=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', nargs='?', default=default_dir)
+    parser.add_argument('--years', help="where to export the graph's years")
+    parser.add_argument('--labels', help='where to export the labels')
+    parser.add_argument('--dates', help='where to export all date claims')
+    args = parser.parse_args()
+
+    export_json(Artifacts(args.directory), args.years, args.labels,
+                args.dates)
@@ -1,32 +1,21 @@
 #!/usr/bin/env python3
 
 import sys
-import json
 from collections import Counter
 
-date_path = 'wd_years.json'
-rel_path = 'statements_final.txt'
-excluded_rels = ['P31', 'P279', 'P61i']
+from artifacts import Artifacts
+from validation import back_edges, default_threshold
+
 wd_url = 'https://wikidata.org/wiki/'
-threshold = 1000
+threshold = default_threshold
 
 if len(sys.argv) > 1:
     threshold = int(sys.argv[1])
 
-with open(date_path) as date_file, open(rel_path) as rel_file:
-    dates = json.loads(date_file.read())
-    rels = rel_file.read().split('\n')[:-1]
-
-    back_edges = []
-    back_edge_ctr = Counter()
-
-    for rel in rels:
-        src, type, dest = rel.split()
-        if type not in excluded_rels and src in dates and dest in dates:
-            d0, d1 = dates[src], dates[dest]
-            if d0 > d1 and d0 - d1 > threshold:
-                print(wd_url + src, d0, type, wd_url + dest, d1)
-                back_edge_ctr.update([type])
-    print(back_edge_ctr)
-
-
+artifacts = Artifacts()
+back_edge_ctr = Counter()
+for src, d0, type, dest, d1 in back_edges(artifacts.edges, artifacts.years,
+                                          threshold=threshold):
+    print(wd_url + src, d0, type, wd_url + dest, d1)
+    back_edge_ctr.update([type])
+print(back_edge_ctr)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""benchmark the JSON backends (and the prefilter) on a slice of a dump"""
+
+import argparse
+import itertools
+import time
+
+from decoders import (available_backends, get_decoder, make_prefilter,
+                      scan_props)
+from dump_reader import open_dump
+from wd_scan import scan_lines
+
+
+def read_sample(dump_path, count):
+    """read the first `count` entity lines of a dump"""
+    with open_dump(dump_path) as infile:
+        lines = itertools.islice(infile, count + 1)
+        return [line for line in lines if line.strip() not in (b'[', b']')]
+
+
+def lines_per_sec(func, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(lines)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(lines) / best
+
+
+def decode_all(loads):
+    def run(lines):
+        for line in lines:
+            loads(line.rstrip(b',\n'))
+    return run
+
+
+def scan_all(loads, keep):
+    def run(lines):
+        scan_lines(lines, fiction_filter=None, loads=loads, keep=keep)
+    return run
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('dump_path')
+    parser.add_argument('--lines', type=int, default=100000,
+                        help='how many lines from the start of the dump')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    lines = read_sample(args.dump_path, args.lines)
+    keep = make_prefilter(scan_props(True))
+    kept = sum(1 for line in lines if keep(line))
+    print(len(lines), "lines,", sum(len(line) for line in lines), "bytes;",
+          kept, "pass the prefilter")
+    print()
+    print('%-10s %14s %14s %14s' % ('backend', 'decode/s', 'scan/s',
+                                    'prefiltered/s'))
+    for backend in available_backends():
+        loads = get_decoder(backend)
+        print('%-10s %14.0f %14.0f %14.0f' % (
+            backend,
+            lines_per_sec(decode_all(loads), lines, args.repeat),
+            lines_per_sec(scan_all(loads, None), lines, args.repeat),
+            lines_per_sec(scan_all(loads, keep), lines, args.repeat)))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""benchmark the columnar dedupe_and_direct/specific_only in edges.py against
+the original string versions, kept here for comparison, on random
+statements"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+
+import edges
+from wd_constants import cg_rels, combined_inverses, likely_nonspecific
+
+
+# the string versions, which work on "Q1 P2 Q3" statements, as wd2cg.py had
+# them before the pipeline moved to edges.py
+def direct(statement):
+    """ensure that a statement is pointing in the right direction, for purposes
+    of labeling and checking based on in-degree and out-degree"""
+    splitup = statement.split()
+    if splitup[1] in combined_inverses:
+        return (splitup[2] + ' ' + combined_inverses[splitup[1]] + ' ' +
+                splitup[0])
+    else:
+        return statement
+
+
+def dedupe_and_direct(statements):
+    """create a set of unique statements oriented in the same direction"""
+    print('starting dedupe_and_direct with', len(statements), 'statements')
+    result = {direct(s) for s in statements}
+    print('finishing dedupe_and_direct with', len(result), 'statements')
+    return result
+
+
+def specific_only(statements, years):
+    """return the subset of statements for which at least one end of a causal
+    statement has a time specified"""
+
+    def is_specific(statement):
+        splitup = statement.split()
+        likely = splitup[1] in likely_nonspecific
+        if likely and splitup[0] not in years and splitup[2] not in years:
+            return False
+        else:
+            return True
+
+    return {statement for statement in statements if is_specific(statement)}
+
+
+def random_edges(count, rng):
+    """random statements between about count/4 items, with a few repeats
+    and inverse pairs, like the real ones"""
+    items = max(count // 4, 10)
+    result = np.empty(count, dtype=edges.edge_dtype)
+    result['src'] = rng.integers(1, items, count)
+    result['dst'] = rng.integers(1, items, count)
+    result['prop'] = rng.integers(0, len(cg_rels), count)
+    repeats = rng.integers(0, count, count // 10)
+    result[repeats[1:]] = result[repeats[:-1]]
+    return result, items
+
+
+def random_years(items, rng):
+    """years for about a third of the items"""
+    dated = np.unique(rng.integers(1, items, items // 3))
+    return {'Q%d' % qid: year for qid, year in
+            zip(dated.tolist(), rng.integers(-500, 2020, len(dated)).tolist())}
+
+
+def timed(func, *args):
+    # the dedupe functions print progress, which would get in the way here
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000000, 10000000, 50000000])
+    parser.add_argument('--max-strings', type=int, default=50000000,
+                        help="don't time the string versions above this many "
+                             "statements (they need ~10 GB at 50M)")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print('%12s %10s %12s %12s %12s %12s' % (
+        'statements', 'version', 'year table', 'dedupe', 'specific', 'total'))
+    for size in args.sizes:
+        edge_array, items = random_edges(size, rng)
+        years = random_years(items, rng)
+        table, convert_time = timed(edges.year_table, years)
+        unique, dedupe_time = timed(edges.dedupe_and_direct, edge_array)
+        final, specific_time = timed(edges.specific_only, unique, table)
+        print('%12d %10s %12.2f %12.2f %12.2f %12.2f' % (
+            size, 'columnar', convert_time, dedupe_time, specific_time,
+            convert_time + dedupe_time + specific_time))
+
+        if size > args.max_strings:
+            continue
+        statements = list(edges.edges_to_strings(edge_array))
+        unique_strings, dedupe_time = timed(dedupe_and_direct, statements)
+        final_strings, specific_time = timed(specific_only, unique_strings,
+                                             years)
+        print('%12d %10s %12s %12.2f %12.2f %12.2f' % (
+            size, 'strings', '-', dedupe_time, specific_time,
+            dedupe_time + specific_time))
+        assert set(edges.edges_to_strings(final)) == final_strings
+        del statements, unique_strings, final_strings
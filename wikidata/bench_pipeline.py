@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""time every stage of wd2cg.py on a synthetic dump (see gen_dump.py), or
+on a given one, without touching the network
+
+The dump is scanned without a filter, the fiction filter is rebuilt from
+it, and the usual outputs are written to a scratch directory, timing each
+step as wd2cg.py's run summary does.  Each stage's throughput is given
+per the items it works through (entities for the scan, statements for
+most of the rest), along with the peak RSS once it's done.  With
+--repeat, the best time of each stage is kept."""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from gen_dump import write_dump
+from metrics import RunMetrics, peak_rss
+from wd2cg import rebuild_filter, write_outputs
+from wd_scan import process_dump
+
+# what each stage's throughput is counted in (see RunMetrics.count), if
+# not statements
+stage_units = {
+    'scan': 'entities',
+    'rebuild_filter': 'entities',
+    'resolve_labels': 'labels',
+    'node_years': 'date_claims',
+    'validation': 'date_claims',
+    'write_artifacts': 'labels',
+    'write_arangodb': 'nodes',
+}
+
+
+def run_pipeline(dump_path, workers, out_dir):
+    """scan, filter and write everything in `out_dir`, returning the
+    RunMetrics summary"""
+    metrics = RunMetrics()
+    cwd = os.getcwd()
+    os.chdir(out_dir)
+    try:
+        # the pipeline's own progress messages would bury the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            with metrics.stage('scan'):
+                scan = process_dump(dump_path, workers=workers,
+                                    progress=metrics.scan_progress())
+            with metrics.stage('rebuild_filter'):
+                rebuild_filter(scan, 'filter.json')
+            write_outputs(scan, metrics=metrics)
+            return metrics.summary()
+    finally:
+        os.chdir(cwd)
+
+
+def best_stages(summaries):
+    """each stage's numbers from the run where it was fastest"""
+    stages = {}
+    for summary in summaries:
+        for name, stage in summary['stages'].items():
+            if (name not in stages or
+                    stage['seconds'] < stages[name]['seconds']):
+                stages[name] = stage
+    return stages
+
+
+def throughputs(stages, summary):
+    counts = summary['counts']
+    rates = {}
+    for name, stage in stages.items():
+        unit = stage_units.get(name, 'statements')
+        # stages too quick to time get no rate
+        rates[name] = (stage['seconds'] and counts[unit] / stage['seconds'],
+                       unit)
+    return rates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dump', help='a dump to use instead of generating '
+                                       'one')
+    parser.add_argument('--entities', type=int, default=100000,
+                        help='size of the generated dump')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compress', action='store_true',
+                        help='gzip the generated dump')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the scratch directory, with the dump and '
+                             'outputs, and print where it is')
+    parser.add_argument('--history', metavar='PATH',
+                        help='append the results to this JSON lines file')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='bench-pipeline-')
+    try:
+        dump_path = args.dump and os.path.abspath(args.dump)
+        if not dump_path:
+            dump_path = os.path.join(scratch, 'dump.json' +
+                                     ('.gz' if args.compress else ''))
+            size = write_dump(dump_path, args.entities, args.seed)
+            print('generated', args.entities, 'entities,', size, 'bytes')
+        summaries = []
+        for run in range(args.repeat):
+            out_dir = os.path.join(scratch, 'run%d' % run)
+            os.mkdir(out_dir)
+            summaries.append(run_pipeline(dump_path, args.workers, out_dir))
+    finally:
+        if args.keep:
+            print('kept', scratch)
+        else:
+            shutil.rmtree(scratch)
+
+    stages = best_stages(summaries)
+    summary = summaries[-1]
+    print()
+    print('%-18s %9s %14s %-12s %10s' % ('stage', 'seconds', 'per second',
+                                         '', 'peak RSS'))
+    for name, (rate, unit) in throughputs(stages, summary).items():
+        print('%-18s %9.3f %14s %-12s %8.0f MB' % (
+            name, stages[name]['seconds'], '%.0f' % rate if rate else '-',
+            unit, stages[name]['peak_rss']['self'] / 1e6))
+    scan = summary['scan']
+    print()
+    print('scan: %.1f MB/s; peak RSS %.0f MB (workers %.0f MB)' % (
+        scan['bytes'] / scan['seconds'] / 1e6, peak_rss()['self'] / 1e6,
+        peak_rss()['children'] / 1e6))
+
+    if args.history:
+        result = {
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'dump': args.dump or 'synthetic', 'entities': args.entities,
+            'seed': args.seed, 'workers': args.workers, 'stages': stages,
+            'scan': scan, 'counts': {key: value for key, value in
+                                     summary['counts'].items()
+                                     if not isinstance(value, dict)}}
+        with open(args.history, 'a') as historyfile:
+            historyfile.write(json.dumps(result) + '\n')
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""time the per-entity cost of the scan on a fixed sample of dump lines
+
+The sample is the first --lines entity lines of the dump; --save-sample
+writes them to a file that can be given in place of the dump next time, so
+that every release is timed on exactly the same entities.  With
+--history, each run's numbers are appended to a JSON lines file to track
+them across releases."""
+
+import argparse
+import datetime
+import json
+import time
+
+from bench_decoders import decode_all, read_sample
+from dates import DateBuffer
+from decoders import get_decoder
+from edges import EdgeBuffer
+from wd_scan import scan_claims, scan_lines
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def visit_claims(objs):
+    """scan_claims() on every item, without the decoding"""
+    statements = EdgeBuffer()
+    dates = DateBuffer()
+    for obj in objs:
+        if obj['type'] == 'item' and 'claims' in obj:
+            scan_claims(obj['id'], obj['claims'], statements, dates)
+    dates.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dump_path', help='a dump, or a saved sample')
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--decoder', default='auto')
+    parser.add_argument('--save-sample', metavar='PATH')
+    parser.add_argument('--history', metavar='PATH',
+                        help='append the results to this JSON lines file')
+    args = parser.parse_args()
+
+    lines = read_sample(args.dump_path, args.lines)[:args.lines]
+    if args.save_sample:
+        with open(args.save_sample, 'wb') as samplefile:
+            samplefile.writelines(lines)
+    loads = get_decoder(args.decoder)
+    objs = [loads(line.rstrip(b',\n')) for line in lines]
+    claims = sum(len(claim_set) for obj in objs
+                 for claim_set in obj.get('claims', {}).values())
+
+    timings = {
+        'decode': best_time(lambda: decode_all(loads)(lines), args.repeat),
+        'claims': best_time(lambda: visit_claims(objs), args.repeat),
+        'scan': best_time(lambda: scan_lines(lines, loads=loads),
+                          args.repeat),
+    }
+    result = {'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+              'sample': args.dump_path, 'entities': len(lines),
+              'claims': claims, 'decoder': args.decoder}
+    print(len(lines), 'entities,', claims, 'claims')
+    for name, elapsed in timings.items():
+        per_entity = elapsed / max(len(lines), 1) * 1e6
+        result[name + '_us_per_entity'] = round(per_entity, 3)
+        print('%-8s %10.2f us/entity' % (name, per_entity))
+    if args.history:
+        with open(args.history, 'a') as historyfile:
+            historyfile.write(json.dumps(result) + '\n')
@@ -1,102 +1,115 @@
 #!/usr/bin/env python3
 """Generate graph of fictional/mythical classes from Wikidata JSON dump"""
 
-import sys
+import argparse
 import json
 
-import networkx as nx
+import numpy as np
 
-from wd_constants import lang_order
+import wd_scan
+from edges import entity_to_int, int_to_entity, is_encodable
 
 roots = ('Q24199478', 'Q14897293')
-subclass = 'P279'
-
-
-def get_label(obj):
-    """get appropriate label, using language fallback chain"""
-    has_sitelinks = 'sitelinks' in obj
-    for lang in lang_order:
-        site = lang + 'wiki'
-        if has_sitelinks and site in obj['sitelinks']:
-            return obj['sitelinks'][site]['title']
-        elif lang in obj['labels']:
-            return obj['labels'][lang]['value']
-    return None
-
-
-def get_item_rels(subj_id, rel, claims):
-    class_inst_stmts = []
-    if rel in claims:
-        for spec in claims[rel]:
-            if 'id' in spec['mainsnak'].get('datavalue', {}).get('value', {}):
-                obj_id = spec['mainsnak']['datavalue']['value']['id']
-                class_inst_stmts.append((subj_id, rel, obj_id))
-    return class_inst_stmts
-
-
-def process_dump(dump_path):
-    statements = []
-    labels = {}
-
-    with open(dump_path) as infile:
-        infile.readline()
-        for line in infile:
-            try:
-                obj = json.loads(line.rstrip(',\n'))
-                qid = obj['id']
-
-                if qid not in labels:
-                    obj_label = get_label(obj)
-                    if obj_label is not None:
-                        labels[qid] = obj_label
-
-                if obj['type'] == 'item':
-                    statements += get_item_rels(qid, subclass, obj['claims'])
-            except Exception as e:
-                print('Exception on', qid, '-', e)
-
-    return statements, labels
-
-
-def graph_from_statements(statements):
-    g = nx.DiGraph()
-    for line in statements:
-        try:
-            source = line[0]
-            destination = line[2]
-            g.add_edge(source, destination)
-        except Exception:
-            print("error on line:", line)
-    return g
-
-
-def get_all_ancestors(graph, node):
-    parents = list(graph.predecessors(node))
-    for p in parents:
-        parents += get_all_ancestors(graph, p)
-    return parents
 
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        dump_path = sys.argv[1]
-    else:
-        dump_path = 'latest-all.json'
-
-    statements, labels = process_dump(dump_path)
-    print("Dump processed!  Making graph...")
-    graph = graph_from_statements(statements)
-    print("Graph created with", graph.number_of_nodes(), "nodes and",
-          graph.number_of_edges(), "edges.")
-    to_filter = list(roots)
-
-    for root in roots:
-        to_filter += get_all_ancestors(graph, root)
-
-    filter_set = set(to_filter)
-    print(len(filter_set), "items in the new filter.")
+def process_dump(dump_path, workers=1):
+    scan = wd_scan.process_dump(dump_path, workers=workers)
+    return scan.subclass_edges, scan.labels
+
+
+class ClassHierarchy:
+    """the P279 hierarchy as a compact CSR adjacency, from each class to its
+    direct subclasses, for finding everything below some classes
+
+    Built once, it can answer any number of closure() queries, each of
+    which visits a class at most once."""
+
+    def __init__(self, statements):
+        pairs = [(entity_to_int(sub), entity_to_int(sup))
+                 for sub, _, sup in statements
+                 if is_encodable(sub) and is_encodable(sup)]
+        ends = np.array(pairs, dtype='<i8').reshape(-1, 2)
+        # number the classes 0..n-1, in QID order
+        self.classes, indexes = np.unique(ends, return_inverse=True)
+        indexes = indexes.reshape(-1, 2)
+        order = np.argsort(indexes[:, 1], kind='stable')
+        self.subclasses = indexes[order, 0]
+        counts = np.bincount(indexes[:, 1], minlength=len(self.classes))
+        self.offsets = np.zeros(len(self.classes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+
+    def __len__(self):
+        return len(self.classes)
+
+    def edge_count(self):
+        return len(self.subclasses)
+
+    def indexes(self, qids):
+        """the indexes of those of `qids` that are in the hierarchy"""
+        numbers = np.array([entity_to_int(qid) for qid in qids
+                            if is_encodable(qid)], dtype='<i8')
+        pos = np.searchsorted(self.classes, numbers)
+        inside = pos < len(self.classes)
+        pos, numbers = pos[inside], numbers[inside]
+        return pos[self.classes[pos] == numbers]
+
+    def closure(self, qids, seen=None):
+        """mark every class at or below `qids`, breadth first, in a mask
+        over self.classes; with a mask from an earlier closure as `seen`,
+        only the classes it doesn't have yet are visited, and it's updated
+        in place"""
+        if seen is None:
+            seen = np.zeros(len(self.classes), dtype=bool)
+        frontier = self.indexes(qids)
+        frontier = np.unique(frontier[~seen[frontier]])
+        seen[frontier] = True
+        while len(frontier):
+            starts = self.offsets[frontier]
+            counts = self.offsets[frontier + 1] - starts
+            # the positions of every subclass of the frontier, gathered in
+            # one go: each class's run of positions starts at its offset
+            runs = np.repeat(starts - np.cumsum(counts) + counts, counts)
+            found = self.subclasses[runs + np.arange(len(runs))]
+            frontier = np.unique(found[~seen[found]])
+            seen[frontier] = True
+        return seen
+
+    def qids(self, mask):
+        return set(map(int_to_entity, self.classes[mask].tolist()))
+
+
+def fiction_closure(statements, extra_roots=()):
+    """find every fictional class below `roots` (and `extra_roots`)"""
+    hierarchy = ClassHierarchy(statements)
+    print("Graph created with", len(hierarchy), "nodes and",
+          hierarchy.edge_count(), "edges.")
+    all_roots = list(roots) + list(extra_roots)
+    return hierarchy.qids(hierarchy.closure(all_roots)) | set(all_roots)
+
+
+def build_filter(statements, labels, extra_roots=()):
+    """map every fictional class below `roots` to its label"""
+    return {item: labels.get(item, item)
+            for item in fiction_closure(statements, extra_roots)}
+
+
+def write_filter(filter_dict, path):
+    with open(path, 'w') as filterfile:
+        filterfile.write(json.dumps(filter_dict, indent=4, sort_keys=True))
 
-    filter_dict = {item: labels.get(item, item) for item in filter_set}
 
-    with open("filter.json", 'w') as filterfile:
-        filterfile.write(json.dumps(filter_dict, indent=4, sort_keys=True))
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('dump_path', nargs='?', default='latest-all.json')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes to scan the dump with')
+    parser.add_argument('--extra-roots', nargs='*', default=[],
+                        metavar='QID',
+                        help='filter the classes below these as well')
+    args = parser.parse_args()
+
+    statements, labels = process_dump(args.dump_path, args.workers)
+    print("Dump processed!  Making graph...")
+    filter_dict = build_filter(statements, labels, args.extra_roots)
+    print(len(filter_dict), "items in the new filter.")
+    write_filter(filter_dict, "filter.json")
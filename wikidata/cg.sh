@@ -4,22 +4,41 @@ echo "CauseGraph: starting Wikidata dump download: $(date --utc +%Y%m%dT%H:%M:%S
 # the .gz is 50% larger than the .bz2, but it's ready sooner and unzips faster
 wget --no-if-modified-since -N https://dumps.wikimedia.org/wikidatawiki/entities/latest-all.json.gz
 echo "CauseGraph: dump downloaded: $(date --utc +%Y%m%dT%H:%M:%S)"
-gunzip -k latest-all.json.gz
-echo "CauseGraph: dump decompressed: $(date --utc +%Y%m%dT%H:%M:%S)"
 WORKSPACE="workspace-$(date --utc +%Y%m%dT%H:%M:%S)"
 mkdir -p $WORKSPACE
 cp wd2cg.py $WORKSPACE
+cp dump_reader.py $WORKSPACE
 cp wd_constants.py $WORKSPACE
-cp makengraph.js $WORKSPACE
+cp wd_scan.py $WORKSPACE
+cp decoders.py $WORKSPACE
+cp edges.py $WORKSPACE
+cp dates.py $WORKSPACE
+cp metrics.py $WORKSPACE
+cp arangodb.py $WORKSPACE
+cp artifacts.py $WORKSPACE
+cp label_store.py $WORKSPACE
+cp graph_export.py $WORKSPACE
+cp graph_report.py $WORKSPACE
+cp validation.py $WORKSPACE
+cp build_fiction_filter.py $WORKSPACE
+cp layout.py $WORKSPACE
 cp fix_labels.py $WORKSPACE
-cp filter.json $WORKSPACE
 cd $WORKSPACE
-./wd2cg.py ../latest-all.json
+# with ARANGODB_URL set, the graph is loaded straight into ArangoDB (only
+# sending what changed since last week's load) instead of being written to
+# nodes.tsv and relationships.tsv.  The checkpoint lives outside the
+# workspace so that re-running this after a crash or reboot resumes the scan
+# (wd2cg.py only resumes a checkpoint of the same dump, and removes it once
+# the run succeeds)
+./wd2cg.py --workers $(nproc) --rebuild-filter --labels graph \
+    --checkpoint ../scan_checkpoint.pickle \
+    ${ARANGODB_URL:+--arangodb "$ARANGODB_URL" \
+                    --arangodb-manifest ../arangodb_manifest} \
+    ../latest-all.json.gz
 echo "CauseGraph: dump processed: $(date --utc +%Y%m%dT%H:%M:%S)"
-# arangoimp --file "nodes.tsv" --type tsv --collection "items" --create-collection true
-# arangoimp --file "relationships.tsv" --type tsv --collection "relations" --from-collection-prefix "items" --to-collection-prefix "items" --create-collection true --create-collection-type edge
-# echo "CauseGraph: ArangoDB import complete: $(date --utc +%Y%m%dT%H:%M:%S)"
-nodejs --max_old_space_size=16384 makengraph.js
+# refine the last release's layout rather than starting from scratch
+PREVIOUS="$(ls -d ../workspace-*/[0-9]*/ 2>/dev/null | sort | tail -n 1)"
+./layout.py ${PREVIOUS:+--warm-start "$PREVIOUS"}
 ./fix_labels.py
 DATE_SHORT="$(date +%Y%m%d)"
 mkdir $DATE_SHORT
@@ -0,0 +1,192 @@
+"""compact storage and batch parsing of Wikidata dates
+
+Each date claim is kept as three integers: the item, the property (an
+index into `date_props`, which has the time properties and "P108 P580"
+style pairs for times in qualifiers) and the date itself.  The year,
+month, day, precision and calendar are packed into one int64, in that
+order of significance, so packed dates sort chronologically.  Time strings
+are collected during the scan and parsed a batch at a time."""
+
+import re
+from array import array
+
+import numpy as np
+
+from edges import entity_to_int
+from wd_constants import all_times, ends, starts, times_plus_nested
+
+# the time properties, then "property qualifier" for times in qualifiers
+date_props = tuple(sorted(all_times)) + tuple(
+    prop + ' ' + qualifier for prop in sorted(times_plus_nested)
+    for qualifier in sorted(all_times))
+date_prop_codes = {prop: code for code, prop in enumerate(date_props)}
+
+# calendar code 0 is for anything else (or nothing)
+calendars = (None,
+             'http://www.wikidata.org/entity/Q1985727',  # proleptic Gregorian
+             'http://www.wikidata.org/entity/Q1985786')  # proleptic Julian
+calendar_codes = {calendar: code for code, calendar in enumerate(calendars)}
+
+# Wikidata's precisions: 9 is a year, 10 a month and 11 a day; lower ones
+# are decades, centuries, millennia etc.
+year_precision, month_precision, day_precision = 9, 10, 11
+
+date_dtype = np.dtype([('qid', '<i8'), ('prop', '<u2'), ('date', '<i8')])
+
+# bit positions in a packed date; the year takes everything above month
+calendar_bits, precision_bits, day_bits, month_bits = 2, 4, 5, 4
+precision_shift = calendar_bits
+day_shift = precision_shift + precision_bits
+month_shift = day_shift + day_bits
+year_shift = month_shift + month_bits
+
+# year, month and day of a time like '+1452-04-15T00:00:00Z', with lines
+# that don't look like that matching nothing (so matches line up with them)
+time_parts = re.compile(r'^(?:([+-]?\d+)-(\d+)-(\d+)T)?.*$', re.MULTILINE)
+
+# which date_props are about starts, or ends (for nested ones, that's up
+# to the qualifier)
+is_start = np.array([prop.split()[-1] in starts for prop in date_props])
+is_end = np.array([prop.split()[-1] in ends for prop in date_props])
+
+
+def parse_times(times):
+    """year, month and day arrays for a list of time strings, and which of
+    them could be parsed"""
+    matches = time_parts.findall('\n'.join(times)) if times else []
+    parts = np.array(matches, dtype=str).reshape(-1, 3)
+    valid = parts[:, 0] != ''
+    numbers = np.zeros((len(parts), 3), dtype=np.int64)
+    numbers[valid] = parts[valid].astype(np.int64)
+    valid &= ((numbers[:, 1] < 1 << month_bits) &
+              (numbers[:, 2] < 1 << day_bits))
+    return numbers[:, 0], numbers[:, 1], numbers[:, 2], valid
+
+
+def pack_dates(years, months, days, precisions, calendar_codes):
+    packed = np.asarray(years, dtype=np.int64) << year_shift
+    packed |= np.asarray(months, dtype=np.int64) << month_shift
+    packed |= np.asarray(days, dtype=np.int64) << day_shift
+    packed |= (np.asarray(precisions, dtype=np.int64) &
+               ((1 << precision_bits) - 1)) << precision_shift
+    packed |= np.asarray(calendar_codes, dtype=np.int64)
+    return packed
+
+
+def unpack_dates(packed):
+    """years, months, days, precisions and calendar codes of packed dates"""
+    packed = np.asarray(packed, dtype=np.int64)
+    return (packed >> year_shift,
+            (packed >> month_shift) & ((1 << month_bits) - 1),
+            (packed >> day_shift) & ((1 << day_bits) - 1),
+            (packed >> precision_shift) & ((1 << precision_bits) - 1),
+            packed & ((1 << calendar_bits) - 1))
+
+
+def format_date(packed):
+    """the time string of a packed date, as Wikidata writes it"""
+    year, month, day, _, _ = (int(part) for part in unpack_dates(packed))
+    return '%s%04d-%02d-%02dT00:00:00Z' % ('-' if year < 0 else '+',
+                                           abs(year), month, day)
+
+
+class DateBuffer:
+    """append-only date claim columns, like edges.EdgeBuffer; time strings
+    are parsed in batches as they pile up"""
+
+    batch_size = 100000
+
+    def __init__(self):
+        self.qid = array('q')
+        self.prop = array('H')
+        self.date = array('q')
+        self.pending = []
+
+    def __len__(self):
+        return len(self.qid) + len(self.pending)
+
+    def add(self, qid, prop, value):
+        """add a claim's time value (with 'time', 'precision' and
+        'calendarmodel', as in the dump)"""
+        self.pending.append((entity_to_int(qid), date_prop_codes[prop],
+                             value['time'], value.get('precision', 0),
+                             calendar_codes.get(value.get('calendarmodel'),
+                                                0)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def add_packed(self, qid, prop, date):
+        self.flush()
+        self.qid.append(entity_to_int(qid))
+        self.prop.append(date_prop_codes[prop])
+        self.date.append(date)
+
+    def flush(self):
+        """parse the pending time strings, dropping any that don't parse"""
+        if not self.pending:
+            return
+        qids, props, times, precisions, calendar_codes = zip(*self.pending)
+        self.pending = []
+        years, months, days, valid = parse_times(list(times))
+        packed = pack_dates(years, months, days, precisions, calendar_codes)
+        self.qid.frombytes(np.array(qids, dtype='<i8')[valid].tobytes())
+        self.prop.frombytes(np.array(props, dtype='<u2')[valid].tobytes())
+        self.date.frombytes(packed[valid].astype('<i8').tobytes())
+
+    def extend(self, other):
+        self.flush()
+        other.flush()
+        self.qid.extend(other.qid)
+        self.prop.extend(other.prop)
+        self.date.extend(other.date)
+
+    def to_array(self):
+        self.flush()
+        dates = np.empty(len(self.qid), dtype=date_dtype)
+        dates['qid'] = np.frombuffer(self.qid, dtype='<i8')
+        dates['prop'] = np.frombuffer(self.prop, dtype='<u2')
+        dates['date'] = np.frombuffer(self.date, dtype='<i8')
+        return dates
+
+    @classmethod
+    def from_array(cls, dates):
+        buffer = cls()
+        buffer.qid.frombytes(dates['qid'].astype('<i8').tobytes())
+        buffer.prop.frombytes(dates['prop'].astype('<u2').tobytes())
+        buffer.date.frombytes(dates['date'].astype('<i8').tobytes())
+        return buffer
+
+
+def group_years(qids, years, latest=False):
+    """the earliest (or latest) year of each QID, as a (sorted QIDs, years)
+    table like edges.year_table()"""
+    if not len(qids):
+        return qids[:0], years[:0]
+    order = np.lexsort((years, qids))
+    qids, years = qids[order], years[order]
+    first = np.ones(len(qids), dtype=bool)
+    first[1:] = qids[1:] != qids[:-1]
+    picks = np.flatnonzero(first)
+    if latest:
+        picks = np.append(picks[1:], len(qids)) - 1
+    return qids[picks], years[picks]
+
+
+def year_vectors(dates, min_precision=0,
+                 kinds=('earliest', 'latest', 'start', 'end')):
+    """year tables (see group_years) for every dated item, of the `kinds`
+    asked for: the earliest and latest year over all its dates, its start
+    (the earliest of its `starts` dates) and its end (the latest of its
+    `ends` dates); dates less precise than min_precision are left out"""
+    years, _, _, precisions, _ = unpack_dates(dates['date'])
+    precise = precisions >= min_precision
+    # which dates each kind is made of, and whether it takes the latest
+    selections = {'earliest': (precise, False), 'latest': (precise, True),
+                  'start': (precise & is_start[dates['prop']], False),
+                  'end': (precise & is_end[dates['prop']], True)}
+    vectors = {}
+    for kind in kinds:
+        selection, latest = selections[kind]
+        vectors[kind] = group_years(dates['qid'][selection],
+                                    years[selection], latest)
+    return vectors
@@ -0,0 +1,87 @@
+"""pluggable JSON decoding for dump lines, with a cheap byte-level prefilter
+for skipping entities before they're decoded at all"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+from wd_constants import cg_rels, lang_order, times_plus_nested
+
+# fastest first
+BACKENDS = ('orjson', 'simdjson', 'json')
+
+
+def available_backends():
+    installed = {'orjson': orjson is not None,
+                 'simdjson': simdjson is not None,
+                 'json': True}
+    return [name for name in BACKENDS if installed[name]]
+
+
+def get_decoder(backend='auto'):
+    """return a function decoding one entity from bytes; 'auto' picks the
+    fastest installed backend"""
+    if backend == 'auto':
+        backend = available_backends()[0]
+    if backend == 'json':
+        return json.loads
+    elif backend == 'orjson' and orjson is not None:
+        fast_loads = orjson.loads
+    elif backend == 'simdjson' and simdjson is not None:
+        fast_loads = simdjson.loads
+    else:
+        raise ValueError('JSON backend not available: ' + backend)
+
+    def loads(data):
+        # the fast decoders are stricter about things like lone surrogates,
+        # which do turn up in the dumps, so let the stdlib have a go too
+        try:
+            return fast_loads(data)
+        except ValueError:
+            return json.loads(data)
+
+    return loads
+
+
+def make_prefilter(props, langs=lang_order):
+    """return a function that tells whether a raw dump line might hold any
+    of `props`, or a label in one of `langs`
+
+    It only looks for the quoted IDs/language codes anywhere in the line,
+    so it can let through lines that turn out to be of no use, but never
+    drops one that has a claim or label we want.  Since every entity's
+    label is kept, and nearly every entity in a real dump has a label or
+    sitelink in `langs`, it lets through nearly every line there, and only
+    adds its own cost; it pays off only on dumps or slices with many
+    unlabelled entities."""
+    # labels come first in each entity, so check the languages first
+    tokens = []
+    for lang in langs:
+        tokens.append(('"' + lang + '"').encode())
+        tokens.append(('"' + lang + 'wiki"').encode())
+    tokens += [('"' + prop + '"').encode() for prop in props]
+    tokens = tuple(tokens)
+
+    def keep(line):
+        for token in tokens:
+            if token in line:
+                return True
+        return False
+
+    return keep
+
+
+def scan_props(collect_classes):
+    """the properties the dump scan needs to see"""
+    props = set(cg_rels) | times_plus_nested
+    if collect_classes:
+        props.update(('P31', 'P279'))
+    return props
@@ -0,0 +1,170 @@
+"""read Wikidata JSON dumps, either whole, as line-aligned byte ranges, or
+decompressed on the fly from .gz, .bz2 or .zst files"""
+
+import bz2
+import collections
+import contextlib
+import gzip
+import io
+import os
+import shutil
+import subprocess
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# external decompressors, best first; running one in its own process keeps
+# decompression off the cores that are parsing JSON, and pigz/lbzip2 also
+# decompress with several threads
+DECOMPRESSORS = {
+    '.gz': (['pigz', '-dc'], ['gzip', '-dc']),
+    '.bz2': (['lbzip2', '-dc'], ['pbzip2', '-dc'], ['bzip2', '-dc']),
+    '.zst': (['zstd', '-dc'],),
+}
+
+CHUNK_SIZE = 1 << 24
+
+
+def is_compressed(dump_path):
+    """check whether a dump has to be decompressed as it's read"""
+    return os.path.splitext(dump_path)[1] in DECOMPRESSORS
+
+
+def find_decompressor(dump_path):
+    """return the command line of the best available external decompressor,
+    or None if there isn't one"""
+    for command in DECOMPRESSORS.get(os.path.splitext(dump_path)[1], ()):
+        if shutil.which(command[0]):
+            return command + [dump_path]
+    return None
+
+
+def open_in_process(dump_path):
+    """fall back on Python's own decompressors"""
+    extension = os.path.splitext(dump_path)[1]
+    if extension == '.gz':
+        return gzip.open(dump_path, 'rb')
+    elif extension == '.bz2':
+        return bz2.open(dump_path, 'rb')
+    elif extension == '.zst':
+        if zstandard is None:
+            raise RuntimeError('reading ' + dump_path + ' needs the zstd '
+                               'command or the zstandard module')
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            open(dump_path, 'rb'), closefd=True)
+        return io.BufferedReader(reader, CHUNK_SIZE)
+    return open(dump_path, 'rb')
+
+
+@contextlib.contextmanager
+def open_dump(dump_path):
+    """open a dump for reading binary lines, decompressing it if needed"""
+    command = find_decompressor(dump_path)
+    if command is None:
+        with open_in_process(dump_path) as infile:
+            yield infile
+        return
+
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE,
+                            bufsize=CHUNK_SIZE)
+    try:
+        yield proc.stdout
+    finally:
+        proc.stdout.close()
+        stopped_early = proc.poll() is None
+        if stopped_early:
+            proc.terminate()
+        returncode = proc.wait()
+    # if we read to the end, a failed decompressor means a truncated dump
+    if returncode and not stopped_early:
+        raise RuntimeError(' '.join(command) + ' exited with ' +
+                           str(returncode))
+
+
+def read_chunks(infile, size=CHUNK_SIZE):
+    """yield blocks of roughly `size` bytes, each ending at a line boundary"""
+    leftover = b''
+    while True:
+        block = infile.read(size)
+        if not block:
+            break
+        block = leftover + block
+        cut = block.rfind(b'\n') + 1
+        if cut:
+            leftover = block[cut:]
+            yield block[:cut]
+        else:
+            leftover = block
+    if leftover:
+        yield leftover
+
+
+def skip_to(infile, offset):
+    """move a dump stream on to byte `offset` (of the decompressed dump),
+    seeking if it can and reading past the bytes if it can't"""
+    if infile.seekable():
+        infile.seek(offset)
+        return
+    while offset:
+        block = infile.read(min(offset, CHUNK_SIZE))
+        if not block:
+            raise RuntimeError('the dump ends before the checkpoint')
+        offset -= len(block)
+
+
+def with_end_offsets(chunks, start=0):
+    """pair each block from read_chunks() with the offset it ends at"""
+    end = start
+    for chunk in chunks:
+        end += len(chunk)
+        yield end, chunk
+
+
+# opentree/opentree_extract.py has a copy of this, as that directory is
+# deployed on its own; a fix to either belongs in both
+def bounded_imap(pool, func, tasks, ahead):
+    """like pool.imap, but only pulls `ahead` tasks from the iterable at a
+    time, so a fast reader can't buffer the whole dump in memory"""
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= ahead:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def shard_ranges(dump_path, count, start=0):
+    """split a dump (from byte `start`, at the start of a line) into at most
+    `count` (start, end) byte ranges, with every boundary moved forward to
+    the start of the next line"""
+    size = os.path.getsize(dump_path)
+    bounds = [start]
+    with open(dump_path, 'rb') as infile:
+        for i in range(1, count):
+            offset = start + (size - start) * i // count
+            if offset <= bounds[-1]:
+                continue
+            # the byte before the offset tells us whether we're mid-line
+            infile.seek(offset - 1)
+            infile.readline()
+            boundary = infile.tell()
+            if bounds[-1] < boundary < size:
+                bounds.append(boundary)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_range(dump_path, start, end):
+    """yield the (binary) lines that start within [start, end)"""
+    with open(dump_path, 'rb') as infile:
+        infile.seek(start)
+        position = start
+        while position < end:
+            line = infile.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
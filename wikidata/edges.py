@@ -0,0 +1,212 @@
+"""compact columnar storage for statements
+
+Statements are kept as (src, prop, dst) integer triples rather than
+"Q1 P2 Q3" strings: item IDs are stored as their number (property IDs,
+which occasionally turn up as targets, as their negated number) and
+properties as small codes into `props`.  Other kinds of entity (lexemes,
+forms etc.) aren't part of CauseGraph and are left out."""
+
+from array import array
+
+import numpy as np
+
+from wd_constants import cg_rels, combined_inverses, likely_nonspecific
+
+# every property a statement can have, before or after direct()
+props = tuple(cg_rels) + tuple(sorted(set(combined_inverses.values()) -
+                                      set(cg_rels)))
+prop_codes = {prop: code for code, prop in enumerate(props)}
+
+edge_dtype = np.dtype([('src', '<i8'), ('prop', 'u1'), ('dst', '<i8')])
+
+# lookup tables: the code each property becomes when directed, and whether
+# directing it swaps the ends
+directed_code = np.array([prop_codes[combined_inverses.get(prop, prop)]
+                          for prop in props], dtype='u1')
+flipped = np.array([prop in combined_inverses for prop in props])
+nonspecific = np.array([prop in likely_nonspecific for prop in props])
+
+
+def entity_to_int(entity_id):
+    """'Q42' -> 42, 'P31' -> -31; raises ValueError for anything else"""
+    kind = entity_id[0]
+    if kind == 'Q':
+        return int(entity_id[1:])
+    elif kind == 'P':
+        return -int(entity_id[1:])
+    raise ValueError('not an item or property: ' + entity_id)
+
+
+def int_to_entity(number):
+    if number < 0:
+        return 'P%d' % -number
+    return 'Q%d' % number
+
+
+def is_encodable(entity_id):
+    return entity_id[:1] in ('Q', 'P') and entity_id[1:].isdigit()
+
+
+class EdgeBuffer:
+    """append-only statement columns, cheap to grow during the scan and to
+    send between processes"""
+
+    def __init__(self):
+        self.src = array('q')
+        self.prop = array('B')
+        self.dst = array('q')
+
+    def __len__(self):
+        return len(self.src)
+
+    def add(self, subject, prop, targets):
+        """add statements from one subject to each of `targets`"""
+        subject_int = entity_to_int(subject)
+        code = prop_codes[prop]
+        for target in targets:
+            self.src.append(subject_int)
+            self.prop.append(code)
+            self.dst.append(entity_to_int(target))
+
+    def extend(self, other):
+        self.src.extend(other.src)
+        self.prop.extend(other.prop)
+        self.dst.extend(other.dst)
+
+    def to_array(self):
+        edges = np.empty(len(self), dtype=edge_dtype)
+        edges['src'] = np.frombuffer(self.src, dtype='<i8')
+        edges['prop'] = np.frombuffer(self.prop, dtype='u1')
+        edges['dst'] = np.frombuffer(self.dst, dtype='<i8')
+        return edges
+
+    @classmethod
+    def from_array(cls, edges):
+        buf = cls()
+        buf.src.frombytes(np.ascontiguousarray(edges['src']).tobytes())
+        buf.prop.frombytes(np.ascontiguousarray(edges['prop']).tobytes())
+        buf.dst.frombytes(np.ascontiguousarray(edges['dst']).tobytes())
+        return buf
+
+
+def edges_from_strings(statements):
+    """parse "Q1 P2 Q3" statements into an edge array"""
+    buf = EdgeBuffer()
+    for statement in statements:
+        src, prop, dst = statement.split()
+        buf.add(src, prop, (dst,))
+    return buf.to_array()
+
+
+def edges_to_strings(edges):
+    """yield each edge as a "Q1 P2 Q3" statement"""
+    for src, code, dst in zip(edges['src'].tolist(), edges['prop'].tolist(),
+                              edges['dst'].tolist()):
+        yield (int_to_entity(src) + ' ' + props[code] + ' ' +
+               int_to_entity(dst))
+
+
+def read_statements(path):
+    """load a statements file (e.g. statements_final.txt) as edges"""
+    with open(path) as infile:
+        return edges_from_strings(line for line in infile if line.strip())
+
+
+def direct_edges(edges):
+    """orient every edge the same way as direct() would, in one pass"""
+    result = np.empty_like(edges)
+    flip = flipped[edges['prop']]
+    result['src'] = np.where(flip, edges['dst'], edges['src'])
+    result['dst'] = np.where(flip, edges['src'], edges['dst'])
+    result['prop'] = directed_code[edges['prop']]
+    return result
+
+
+def pack_edges(edges):
+    """pack each edge into one uint64 that sorts in (src, dst, prop) order,
+    returning the keys and what's needed to unpack them, or None if the IDs
+    span too wide a range to fit"""
+    if not len(edges):
+        return None
+    src_min, dst_min = int(edges['src'].min()), int(edges['dst'].min())
+    src_bits = (int(edges['src'].max()) - src_min).bit_length()
+    dst_bits = (int(edges['dst'].max()) - dst_min).bit_length()
+    if src_bits + dst_bits + 8 > 64:
+        return None
+    keys = (edges['src'] - src_min).astype(np.uint64) << np.uint64(
+        dst_bits + 8)
+    keys |= (edges['dst'] - dst_min).astype(np.uint64) << np.uint64(8)
+    keys |= edges['prop'].astype(np.uint64)
+    return keys, (src_min, dst_min, dst_bits)
+
+
+def unpack_edges(keys, packing):
+    src_min, dst_min, dst_bits = packing
+    edges = np.empty(len(keys), dtype=edge_dtype)
+    edges['src'] = (keys >> np.uint64(dst_bits + 8)).astype('<i8') + src_min
+    dst_mask = np.uint64((1 << dst_bits) - 1)
+    edges['dst'] = ((keys >> np.uint64(8)) & dst_mask).astype('<i8') + dst_min
+    edges['prop'] = (keys & np.uint64(0xff)).astype('u1')
+    return edges
+
+
+def unique_edges(edges):
+    """drop duplicate edges (sorting them by src, dst, prop on the way)"""
+    packed = pack_edges(edges)
+    if packed is not None:
+        # sorting plain integers is far faster than sorting records
+        keys, packing = packed
+        keys.sort()
+        first = np.ones(len(keys), dtype=bool)
+        np.not_equal(keys[1:], keys[:-1], out=first[1:])
+        return unpack_edges(keys[first], packing)
+
+    order = np.lexsort((edges['prop'], edges['dst'], edges['src']))
+    ordered = edges[order]
+    first = np.ones(len(ordered), dtype=bool)
+    first[1:] = ((ordered['src'][1:] != ordered['src'][:-1]) |
+                 (ordered['dst'][1:] != ordered['dst'][:-1]) |
+                 (ordered['prop'][1:] != ordered['prop'][:-1]))
+    return ordered[first]
+
+
+def dedupe_and_direct(edges):
+    """the unique edges, all oriented in the same direction"""
+    print('starting dedupe_and_direct with', len(edges), 'statements')
+    result = unique_edges(direct_edges(edges))
+    print('finishing dedupe_and_direct with', len(result), 'statements')
+    return result
+
+
+def year_table(years):
+    """turn a {QID: year} dict into sorted QID ints and matching years, for
+    looking up many QIDs at once with lookup_years()"""
+    qids = np.fromiter((entity_to_int(qid) for qid in years), dtype='<i8',
+                       count=len(years))
+    values = np.fromiter(years.values(), dtype='<i8', count=len(years))
+    order = np.argsort(qids)
+    return qids[order], values[order]
+
+
+def lookup_years(table, ids):
+    """look up an array of entity ints in a year table, returning their
+    years (meaningless where not found) and a mask of which were found"""
+    qids, values = table
+    if not len(qids):
+        return np.zeros(len(ids), dtype='<i8'), np.zeros(len(ids), dtype=bool)
+    pos = np.searchsorted(qids, ids)
+    pos[pos == len(qids)] = 0
+    return values[pos], qids[pos] == ids
+
+
+def specific_only(edges, years):
+    """the edges for which at least one end of a causal statement has a
+    time specified; `years` is a dict or a year table"""
+    if isinstance(years, dict):
+        years = year_table(years)
+    keep = ~nonspecific[edges['prop']]
+    candidates = np.flatnonzero(~keep)
+    _, src_dated = lookup_years(years, edges['src'][candidates])
+    _, dst_dated = lookup_years(years, edges['dst'][candidates])
+    keep[candidates] = src_dated | dst_dated
+    return edges[keep]
@@ -2,21 +2,26 @@
 
 import json
 
+from label_store import LabelStore
+
+batch_size = 100000
+
 f = open('labels.json', 'r')
 graphlabels = json.loads(f.read())
 f.close()
 
-f = open('wd_labels.json', 'r')
-wd_labels = json.loads(f.read())
-f.close()
+wd_labels = LabelStore()
 
 newlabels = []
 
-for label in graphlabels:
-    if label in wd_labels:
-        newlabels.append(' '.join([wd_labels[label], '-', label]))
-    else:
-        newlabels.append(label)
+for i in range(0, len(graphlabels), batch_size):
+    batch = graphlabels[i:i + batch_size]
+    batch_labels = wd_labels.get_many(batch)
+    for label in batch:
+        if label in batch_labels:
+            newlabels.append(' '.join([batch_labels[label], '-', label]))
+        else:
+            newlabels.append(label)
 
 with open('newlabels.json', 'w') as outfile:
     outfile.write(json.dumps(newlabels, indent=True))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""write a synthetic Wikidata JSON dump, for timing the pipeline offline
+
+The entities are shaped like the real ones, at about their real size: a
+class hierarchy (P279) with real and fictional branches under the fiction
+filter's roots, people with birth/death dates, parents, teachers and
+influences, works based on or inspired by earlier works, and events with
+causes.  Items get P31s (some of them fictional classes), employers and
+schools with start/end time qualifiers, labels and descriptions in a
+skewed mix of the `lang_order` languages, sitelinks and aliases; a few
+properties are thrown in as well.  Dates have year, month or day
+precision, with the odd Julian one, and some in the month/day form that
+date_flagger.py looks for.
+
+The same --seed and --entities always give the same dump; a .gz or .bz2
+output path is compressed as it's written."""
+
+import argparse
+import bz2
+import gzip
+import json
+import random
+
+from build_fiction_filter import roots
+from wd_constants import lang_order
+
+gregorian = 'http://www.wikidata.org/entity/Q1985727'
+julian = 'http://www.wikidata.org/entity/Q1985786'
+human = 'Q5'
+
+# what share of the entities are of each kind; the rest are works
+class_share = 0.01
+people_share = 0.45
+event_share = 0.1
+property_share = 0.005
+
+words = ('ancient', 'battle', 'river', 'house', 'treaty', 'song', 'theory',
+         'king', 'church', 'war', 'novel', 'school', 'bridge', 'painting',
+         'revolution', 'island', 'festival', 'company', 'engine', 'poem')
+
+
+def entity_value(qid):
+    return {'value': {'entity-type': 'item', 'numeric-id': int(qid[1:]),
+                      'id': qid},
+            'type': 'wikibase-entityid'}
+
+
+def time_value(rng, year):
+    """a time around `year`, at year, month or day precision"""
+    precision = rng.choice((9, 10, 11, 11, 11))
+    month = rng.randint(1, 12) if precision >= 10 else 0
+    day = rng.randint(1, 28) if precision == 11 else 0
+    if rng.random() < 0.005:
+        # a day and month that ended up as a month and year
+        year, month, day, precision = rng.randint(1, 31), month or 1, 0, 10
+    calendar = julian if year < 1582 and rng.random() < 0.3 else gregorian
+    return {'value': {'time': '%s%04d-%02d-%02dT00:00:00Z' % (
+                          '-' if year < 0 else '+', abs(year), month, day),
+                      'timezone': 0, 'before': 0, 'after': 0,
+                      'precision': precision, 'calendarmodel': calendar},
+            'type': 'time'}
+
+
+def snak(prop, datavalue):
+    return {'snaktype': 'value', 'property': prop, 'datavalue': datavalue,
+            'datatype': 'time' if datavalue['type'] == 'time'
+            else 'wikibase-item'}
+
+
+def statement(rng, prop, datavalue, qualifiers=None):
+    claim = {'mainsnak': snak(prop, datavalue), 'type': 'statement',
+             'id': 'Q$%08x' % rng.getrandbits(32), 'rank': 'normal'}
+    if qualifiers:
+        claim['qualifiers'] = {
+            qualifier: [snak(qualifier, value)]
+            for qualifier, value in qualifiers.items()}
+        claim['qualifiers-order'] = list(qualifiers)
+    return claim
+
+
+class DumpGenerator:
+    """makes the entities of a dump of `count` entities"""
+
+    def __init__(self, count, seed=0):
+        self.rng = random.Random(seed)
+        self.count = count
+        self.classes = max(int(count * class_share), 4)
+        self.people = int(count * people_share)
+        self.events = int(count * event_share)
+        self.properties = int(count * property_share)
+        # QIDs are handed out by kind, in this order
+        self.first_person = self.classes + 1
+        self.first_event = self.first_person + self.people
+        self.first_work = self.first_event + self.events
+        self.works = count - self.properties - self.first_work + 1
+        self.years = {}
+
+    def pick(self, first, count):
+        return 'Q%d' % self.rng.randint(first, first + max(count, 1) - 1)
+
+    def year(self, qid):
+        """each item's rough year, chosen the first time it's needed"""
+        if qid not in self.years:
+            self.years[qid] = int(self.rng.triangular(-800, 2020, 1950))
+        return self.years[qid]
+
+    def text(self, words_count):
+        return ' '.join(self.rng.choice(words) for _ in range(words_count))
+
+    def terms(self, number):
+        """labels, descriptions and aliases, with English the most common
+        and the later languages rarer"""
+        rng = self.rng
+        labels, descriptions, aliases = {}, {}, {}
+        for rank, lang in enumerate(lang_order):
+            if rng.random() < 0.9 / (rank + 1) ** 0.7:
+                labels[lang] = {'language': lang, 'value': '%s %d' % (
+                    self.text(rng.randint(1, 3)), number)}
+                descriptions[lang] = {'language': lang,
+                                      'value': self.text(rng.randint(3, 12))}
+                if rng.random() < 0.2:
+                    aliases[lang] = [{'language': lang,
+                                      'value': self.text(2)}]
+        return labels, descriptions, aliases
+
+    def sitelinks(self, labels):
+        links = {}
+        for lang, label in labels.items():
+            if self.rng.random() < 0.4:
+                site = lang + 'wiki'
+                links[site] = {'site': site, 'title': label['value'].title(),
+                               'badges': []}
+        return links
+
+    def claims(self, number):
+        rng = self.rng
+        qid = 'Q%d' % number
+        claims = {}
+
+        def add(prop, datavalue, qualifiers=None):
+            claims.setdefault(prop, []).append(
+                statement(rng, prop, datavalue, qualifiers))
+
+        def add_time(prop, year):
+            add(prop, time_value(rng, year))
+
+        if number <= self.classes:
+            # every class but the first is a subclass of an earlier one, or
+            # now and then of one of the fiction filter's roots
+            if number > 1:
+                parent = self.pick(1, number - 1)
+                if rng.random() < 0.05:
+                    parent = rng.choice(roots)
+                add('P279', entity_value(parent))
+            return claims
+
+        year = self.year(qid)
+        if number < self.first_event:
+            add('P31', entity_value(human))
+            add_time('P569', year)
+            if rng.random() < 0.7:
+                add_time('P570', year + rng.randint(20, 90))
+            for prop, chance in (('P22', 0.2), ('P25', 0.15), ('P40', 0.2),
+                                 ('P184', 0.05), ('P1066', 0.05),
+                                 ('P802', 0.05), ('P737', 0.15)):
+                while rng.random() < chance:
+                    add(prop, entity_value(self.pick(self.first_person,
+                                                     self.people)))
+            for prop in ('P108', 'P69'):
+                if rng.random() < 0.3:
+                    start = year + rng.randint(15, 40)
+                    add(prop, entity_value(self.pick(self.first_work,
+                                                     self.works)),
+                        {'P580': time_value(rng, start),
+                         'P582': time_value(rng, start + rng.randint(1, 30))})
+            if rng.random() < 0.1:
+                add('P26', entity_value(self.pick(self.first_person,
+                                                  self.people)),
+                    {'P580': time_value(rng, year + rng.randint(18, 40))})
+        elif number < self.first_work:
+            add('P31', entity_value(self.pick(1, self.classes)))
+            add_time(rng.choice(('P585', 'P580', 'P571')), year)
+            for prop, chance in (('P828', 0.4), ('P1542', 0.3),
+                                 ('P1478', 0.05), ('P1479', 0.1)):
+                while rng.random() < chance:
+                    add(prop, entity_value(self.pick(self.first_event,
+                                                     self.events)))
+        else:
+            add('P31', entity_value(self.pick(1, self.classes)))
+            if rng.random() < 0.8:
+                add_time(rng.choice(('P577', 'P571', 'P1191')), year)
+            for prop, chance in (('P144', 0.2), ('P941', 0.15),
+                                 ('P2675', 0.02), ('P170', 0.5)):
+                while rng.random() < chance:
+                    add(prop, entity_value(self.pick(self.first_work,
+                                                     self.works)))
+        if rng.random() < 0.02:
+            # "no value" claims have no datavalue at all
+            claims.setdefault('P737', []).append(
+                {'mainsnak': {'snaktype': 'novalue', 'property': 'P737'},
+                 'type': 'statement', 'rank': 'normal'})
+        return claims
+
+    def entity(self, number):
+        if number > self.count - self.properties:
+            pid = 'P%d' % (number - self.count + self.properties + 10000)
+            labels, descriptions, aliases = self.terms(number)
+            return {'type': 'property', 'datatype': 'wikibase-item',
+                    'id': pid, 'labels': labels,
+                    'descriptions': descriptions, 'aliases': aliases,
+                    'claims': {}}
+        labels, descriptions, aliases = self.terms(number)
+        return {'type': 'item', 'id': 'Q%d' % number, 'labels': labels,
+                'descriptions': descriptions, 'aliases': aliases,
+                'claims': self.claims(number),
+                'sitelinks': self.sitelinks(labels)}
+
+    def lines(self):
+        """the dump's lines, as bytes"""
+        yield b'[\n'
+        for number in range(1, self.count + 1):
+            end = b',\n' if number < self.count else b'\n'
+            yield json.dumps(self.entity(number),
+                             separators=(',', ':')).encode() + end
+        yield b']\n'
+
+
+def write_dump(path, count, seed=0):
+    """write a dump of `count` entities to `path`, returning its
+    (uncompressed) size in bytes"""
+    if path.endswith('.gz'):
+        outfile = gzip.open(path, 'wb', compresslevel=6)
+    elif path.endswith('.bz2'):
+        outfile = bz2.open(path, 'wb')
+    else:
+        outfile = open(path, 'wb')
+    size = 0
+    with outfile:
+        for line in DumpGenerator(count, seed).lines():
+            outfile.write(line)
+            size += len(line)
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='where to write the dump')
+    parser.add_argument('--entities', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    size = write_dump(args.path, args.entities, args.seed)
+    print(args.entities, 'entities,', size, 'bytes')
@@ -0,0 +1,63 @@
+"""export the final graph for the Node layout step, straight from the edge
+arrays (no networkx graph or DOT text in between)
+
+Two files are written:
+
+    graph_nodes.json    {"ids": [QID, ...], "years": [year or null, ...],
+                         "linkTypes": [property, ...]}
+    graph_links.bin     one record per link: from and to (int32 indexes
+                        into "ids") then type (uint8 index into
+                        "linkTypes"), little-endian, packed as 9 bytes
+
+makengraph.js builds its ngraph graph from these directly."""
+
+import json
+
+import numpy as np
+
+from edges import int_to_entity, lookup_years, props
+
+link_dtype = np.dtype([('from', '<i4'), ('to', '<i4'), ('type', 'u1')])
+
+
+def node_table(edges):
+    """the sorted, unique entity ints at either end of the edges, and the
+    node index of each edge's ends"""
+    ends = np.concatenate((edges['src'], edges['dst']))
+    nodes, indexes = np.unique(ends, return_inverse=True)
+    return nodes, indexes[:len(edges)], indexes[len(edges):]
+
+
+def export_graph(edges, year_table, nodes_path='graph_nodes.json',
+                 links_path='graph_links.bin'):
+    """write the graph files for makengraph.js, with each node's year from a
+    year table (see edges.year_table)"""
+    nodes, from_index, to_index = node_table(edges)
+    years, dated = lookup_years(year_table, nodes)
+    node_years = [year if is_dated else None
+                  for year, is_dated in zip(years.tolist(), dated.tolist())]
+
+    with open(nodes_path, 'w') as nodesfile:
+        nodesfile.write(json.dumps({'ids': [int_to_entity(node) for node in
+                                            nodes.tolist()],
+                                    'years': node_years,
+                                    'linkTypes': props}))
+
+    links = np.empty(len(edges), dtype=link_dtype)
+    links['from'] = from_index
+    links['to'] = to_index
+    links['type'] = edges['prop']
+    links.tofile(links_path)
+    return len(nodes), len(links)
+
+
+def read_graph(nodes_path='graph_nodes.json', links_path='graph_links.bin'):
+    """read the files written by export_graph: the node QIDs, their years
+    and whether they have one, the link types and the links"""
+    with open(nodes_path) as nodesfile:
+        nodes = json.loads(nodesfile.read())
+    dated = np.array([year is not None for year in nodes['years']],
+                     dtype=bool)
+    years = np.array([year or 0 for year in nodes['years']], dtype='<i8')
+    links = np.fromfile(links_path, dtype=link_dtype)
+    return nodes['ids'], years, dated, nodes['linkTypes'], links
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""statistics and constraint checks on the final graph, worked out on the
+edge and year arrays (see edges.py) rather than on a networkx graph
+
+The checks look at directed statements, so "A P40 B" means A is B's
+parent and "A P737i B" that A influenced B.  The report is written as
+JSON, with the QIDs of every offending statement."""
+
+import argparse
+import json
+import pprint
+
+import numpy as np
+
+from artifacts import Artifacts, default_dir
+from edges import int_to_entity, lookup_years, prop_codes, props
+
+# statements whose source starts more than max_lead years after their
+# target can't be right: (name, property, max_lead)
+temporal_checks = (
+    # parents born after their "children"
+    ('parent_born_after_child', 'P40', 0),
+    # people "influenced by" someone born so long after them that they must
+    # have been dead by then (we only have start years, not deaths)
+    ('influence_before_birth', 'P737i', 100),
+)
+# properties that can't hold both ways between the same two items
+one_way_props = ('P40', 'P185')
+
+
+def rel_stats(edges):
+    counts = np.bincount(edges['prop'], minlength=len(props)).tolist()
+    return {props[code]: count for code, count in enumerate(counts) if count}
+
+
+def selfloops(edges):
+    loops = edges['src'][edges['src'] == edges['dst']]
+    return [int_to_entity(number) for number in np.unique(loops).tolist()]
+
+
+def temporal_violations(edges, year_table, prop, max_lead):
+    """statements using prop whose source's year is more than max_lead
+    years after its target's, as [source, target, year, year] lists"""
+    if prop not in prop_codes:
+        return []
+    chosen = edges[edges['prop'] == prop_codes[prop]]
+    src_years, src_dated = lookup_years(year_table, chosen['src'])
+    dst_years, dst_dated = lookup_years(year_table, chosen['dst'])
+    bad = src_dated & dst_dated & (src_years - dst_years > max_lead)
+    return [[int_to_entity(src), int_to_entity(dst), src_year, dst_year]
+            for src, dst, src_year, dst_year in zip(
+                chosen['src'][bad].tolist(), chosen['dst'][bad].tolist(),
+                src_years[bad].tolist(), dst_years[bad].tolist())]
+
+
+def reciprocal_violations(edges, prop):
+    """pairs of items with prop statements going both ways between them"""
+    if prop not in prop_codes:
+        return []
+    chosen = edges[edges['prop'] == prop_codes[prop]]
+    # join the statements against themselves reversed, on (src, dst) keys
+    # built from each end's index into the sorted ends
+    ends, indexes = np.unique(np.concatenate((chosen['src'], chosen['dst'])),
+                              return_inverse=True)
+    count = len(ends)
+    src, dst = indexes[:len(chosen)], indexes[len(chosen):]
+    forward = src * count + dst
+    mutual = np.isin(forward, dst * count + src) & (src < dst)
+    pairs = np.unique(forward[mutual])
+    return [[int_to_entity(first), int_to_entity(second)]
+            for first, second in zip(ends[pairs // count].tolist(),
+                                     ends[pairs % count].tolist())]
+
+
+def graph_report(edges, year_table, checks=temporal_checks,
+                 one_way=one_way_props):
+    """report graph statistics and violations of rules/constraints"""
+    report = {}
+    report['node_count'] = len(np.unique(np.concatenate((edges['src'],
+                                                         edges['dst']))))
+    report['edge_count'] = len(edges)
+    report['rel_stats'] = rel_stats(edges)
+    report['selfloops'] = selfloops(edges)
+    for name, prop, max_lead in checks:
+        found = temporal_violations(edges, year_table, prop, max_lead)
+        report[name] = {'property': prop, 'max_lead': max_lead,
+                        'count': len(found), 'statements': found}
+    report['impossible_reciprocals'] = {
+        prop: reciprocal_violations(edges, prop) for prop in one_way}
+    # TODO check other constraints of the various cg_rels
+    return report
+
+
+def summarise(report):
+    """the report with its lists of offenders replaced by their length"""
+    def shorten(value):
+        if isinstance(value, list):
+            return len(value)
+        if isinstance(value, dict):
+            return {key: shorten(item) for key, item in value.items()
+                    if key != 'statements'}
+        return value
+    return {key: value if key == 'rel_stats' else shorten(value)
+            for key, value in report.items()}
+
+
+def write_report(report, path):
+    with open(path, 'w') as outfile:
+        outfile.write(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', nargs='?', default=default_dir)
+    parser.add_argument('--out', default='graph_report.json')
+    for name, prop, max_lead in temporal_checks:
+        parser.add_argument('--%s' % name.replace('_', '-'), type=int,
+                            default=max_lead, metavar='YEARS',
+                            help='flag %s statements whose source starts more '
+                                 'than this many years after the target '
+                                 '(default: %d)' % (prop, max_lead))
+    parser.add_argument('--one-way', nargs='*', default=list(one_way_props),
+                        metavar='PROP',
+                        help='properties that may not go both ways between '
+                             'two items')
+    args = parser.parse_args()
+
+    artifacts = Artifacts(args.directory)
+    checks = [(name, prop, getattr(args, name))
+              for name, prop, _ in temporal_checks]
+    report = graph_report(artifacts.edges, artifacts.years, checks,
+                          args.one_way)
+    write_report(report, args.out)
+    pprint.pprint(summarise(report))
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""keep CauseGraph up to date from changed entities instead of full dumps
+
+`init` scans a full dump and saves what was extracted from each entity in a
+SQLite state store; `update` takes files of changed entities (one entity
+JSON per line, as in the dumps, possibly compressed) and replaces just
+those entities in the store.  A line consisting of {"id": ..., "deleted":
+true} removes an entity.
+
+The store keeps everything unfiltered, along with the class claims needed
+to decide what's fictional.  Next to that it keeps the graph derived with
+the fiction filter: what each real item brings to it (its directed
+statements, the nodes it adds and its year), the graph's nodes with their
+years, and the final statements.  An update only re-derives the rows of the
+changed items and of the nodes and statements around them, and
+statements_final.txt, wd_years.json, nodes.tsv and relationships.tsv are
+then streamed out of those tables.  The graph is derived afresh when the
+fiction filter changes.  With --all-outputs, everything else wd2cg.py
+writes (artifacts, graph files, reports) is written too, which takes a
+full export."""
+
+import argparse
+import json
+import sqlite3
+from collections import defaultdict
+
+from build_fiction_filter import fiction_closure, write_filter
+from decoders import BACKENDS, get_decoder
+from dump_reader import open_dump
+from dates import DateBuffer, date_props
+from edges import (directed_code, edges_to_strings, entity_to_int, flipped,
+                   int_to_entity, is_encodable, nonspecific, prop_codes, props)
+from metrics import RunMetrics
+from wd2cg import load_item_filter, node_years, write_outputs
+from wd_scan import (ScanResult, filter_digest, is_real_targets,
+                     process_dump, scan_lines, subclass)
+
+# items read at a time when deriving the whole graph, and QIDs per lookup
+batch_size = 10000
+lookup_size = 500
+
+schema = '''
+CREATE TABLE IF NOT EXISTS labels (
+    qid TEXT PRIMARY KEY,
+    label TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS items (
+    qid TEXT PRIMARY KEY,
+    statements TEXT NOT NULL,   -- "Q P Q" statements, one per line
+    dates TEXT NOT NULL,        -- JSON [property, packed date] pairs
+    cg_subject INTEGER NOT NULL,
+    classes TEXT,               -- JSON of ScanResult.class_claims[qid]
+    superclasses TEXT NOT NULL  -- P279 targets, one per line
+) WITHOUT ROWID;
+
+-- the graph, derived from the real items; entities are stored as
+-- edges.entity_to_int() numbers and properties as codes into edges.props
+CREATE TABLE IF NOT EXISTS item_edges (
+    source INTEGER NOT NULL,    -- the item that made the statement
+    src INTEGER NOT NULL,       -- the statement, as direct_edges() has it
+    prop INTEGER NOT NULL,
+    dst INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS item_edges_source ON item_edges (source);
+CREATE INDEX IF NOT EXISTS item_edges_key ON item_edges (src, dst, prop);
+CREATE INDEX IF NOT EXISTS item_edges_dst ON item_edges (dst);
+CREATE TABLE IF NOT EXISTS item_nodes (
+    source INTEGER NOT NULL,    -- the item that makes `node` a graph node
+    node INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS item_nodes_source ON item_nodes (source);
+CREATE INDEX IF NOT EXISTS item_nodes_node ON item_nodes (node);
+CREATE TABLE IF NOT EXISTS item_years (
+    qid INTEGER PRIMARY KEY,
+    year INTEGER NOT NULL       -- as wd2cg.node_years() has it
+);
+CREATE TABLE IF NOT EXISTS graph_nodes (
+    qid INTEGER PRIMARY KEY,
+    year INTEGER                -- NULL if undated
+);
+CREATE TABLE IF NOT EXISTS final_edges (
+    src INTEGER NOT NULL,
+    dst INTEGER NOT NULL,
+    prop INTEGER NOT NULL,
+    PRIMARY KEY (src, dst, prop)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+'''
+derived_tables = ('item_edges', 'item_nodes', 'item_years', 'graph_nodes',
+                  'final_edges')
+
+# whether a directed statement is final, as edges.specific_only() decides
+is_final = '''(prop NOT IN (%s)
+    OR EXISTS (SELECT 1 FROM graph_nodes
+               WHERE qid = src AND year IS NOT NULL)
+    OR EXISTS (SELECT 1 FROM graph_nodes
+               WHERE qid = dst AND year IS NOT NULL))''' % ', '.join(
+    str(code) for code in range(len(props)) if nonspecific[code])
+
+
+def open_store(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(schema)
+    return conn
+
+
+def save_scan(conn, scan):
+    """store the per-entity results of a scan run without a fiction filter,
+    replacing whatever was there for those entities"""
+    statements = defaultdict(list)
+    for statement in edges_to_strings(scan.statements.to_array()):
+        statements[statement.split(' ', 1)[0]].append(statement)
+    superclasses = defaultdict(list)
+    for qid, _, superclass in scan.subclass_edges:
+        superclasses[qid].append(superclass)
+
+    dates = defaultdict(list)
+    date_array = scan.dates.to_array()
+    for number, prop, date in zip(date_array['qid'].tolist(),
+                                  date_array['prop'].tolist(),
+                                  date_array['date'].tolist()):
+        dates[int_to_entity(number)].append([date_props[prop], date])
+
+    qids = (set(dates) | set(statements) | set(superclasses) |
+            set(scan.class_claims) | scan.cg_subjects)
+    rows = ((qid,
+             '\n'.join(statements.get(qid, ())),
+             json.dumps(dates.get(qid, [])),
+             qid in scan.cg_subjects,
+             json.dumps(scan.class_claims[qid])
+             if qid in scan.class_claims else None,
+             '\n'.join(superclasses.get(qid, ())))
+            for qid in qids)
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO items VALUES (?,?,?,?,?,?)',
+                         rows)
+        conn.executemany('INSERT OR REPLACE INTO labels VALUES (?,?)',
+                         scan.labels.items())
+
+
+def load_scan(conn):
+    """rebuild the scan results, as if the whole dump had been scanned
+    without a fiction filter, leaving out the labels (see load_labels)"""
+    scan = ScanResult()
+    for (qid, statements, dates, cg_subject, classes,
+         superclasses) in conn.execute('SELECT * FROM items'):
+        for statement in statements.split('\n') if statements else ():
+            src, prop, dst = statement.split()
+            scan.statements.add(src, prop, (dst,))
+        for prop, date in json.loads(dates):
+            if isinstance(date, str):
+                # stores made before dates were packed
+                scan.dates.add(qid, prop, {'time': date})
+            else:
+                scan.dates.add_packed(qid, prop, date)
+        if cg_subject:
+            scan.cg_subjects.add(qid)
+        if classes is not None:
+            instance_of, subclass_of = json.loads(classes)
+            scan.class_claims[qid] = (instance_of, subclass_of)
+        if superclasses:
+            scan.subclass_edges += [(qid, subclass, superclass)
+                                    for superclass in superclasses.split('\n')]
+    return scan
+
+
+def apply_changes(conn, lines, loads):
+    """replace the stored results for each changed entity, returning their
+    IDs; if an entity appears more than once, its last version wins"""
+    latest = {}
+    for line in lines:
+        if line.strip() in (b'', b'[', b']'):
+            continue
+        obj = loads(line.rstrip(b',\n'))
+        latest[obj['id']] = None if obj.get('deleted') else line
+
+    with conn:
+        conn.executemany('DELETE FROM items WHERE qid = ?',
+                         ((qid,) for qid in latest))
+        conn.executemany('DELETE FROM labels WHERE qid = ?',
+                         ((qid,) for qid in latest))
+    changed = [line for line in latest.values() if line is not None]
+    save_scan(conn, scan_lines(changed, loads=loads))
+    return set(latest)
+
+
+def chunks(items, size=lookup_size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def marks(values):
+    return ', '.join('?' * len(values))
+
+
+def load_labels(conn, qids):
+    """{QID: label} of just the QIDs asked for"""
+    labels = {}
+    for chunk in chunks(qids):
+        labels.update(conn.execute(
+            'SELECT qid, label FROM labels WHERE qid IN (%s)' % marks(chunk),
+            chunk))
+    return labels
+
+
+def store_filter(conn, path, rebuild=False):
+    """the fiction filter in `path`, or one rebuilt from the stored P279
+    edges and saved there"""
+    if not rebuild:
+        return load_item_filter(path)
+    subclass_edges = [
+        (qid, subclass, superclass) for qid, superclasses in conn.execute(
+            "SELECT qid, superclasses FROM items WHERE superclasses != ''")
+        for superclass in superclasses.split('\n')]
+    filter_set = fiction_closure(subclass_edges)
+    print(len(filter_set), "items in the new filter.")
+    labels = load_labels(conn, filter_set)
+    write_filter({item: labels.get(item, item) for item in filter_set}, path)
+    return frozenset(filter_set)
+
+
+def contributions(rows, item_filter):
+    """what some rows of the items table bring to the graph, as rows for
+    item_nodes, item_edges and item_years (fictional items bring nothing)"""
+    nodes, item_edges, dates, real = [], [], DateBuffer(), []
+    for qid, statements, item_dates, cg_subject, classes, _ in rows:
+        if not is_encodable(qid):
+            continue
+        if classes is not None:
+            instance_of, subclass_of = json.loads(classes)
+            if not is_real_targets(qid, instance_of, subclass_of,
+                                   item_filter):
+                continue
+        source = entity_to_int(qid)
+        real.append(qid)
+        if cg_subject:
+            nodes.append((source, source))
+        for statement in statements.split('\n') if statements else ():
+            _, prop, target = statement.split()
+            code, dst = prop_codes[prop], entity_to_int(target)
+            nodes.append((source, dst))
+            if flipped[code]:
+                item_edges.append((source, dst, int(directed_code[code]),
+                                   source))
+            else:
+                item_edges.append((source, source, code, dst))
+        for prop, date in json.loads(item_dates):
+            if isinstance(date, str):
+                dates.add(qid, prop, {'time': date})
+            else:
+                dates.add_packed(qid, prop, date)
+    qids, years = node_years(dates.to_array(), real)
+    return nodes, item_edges, list(zip(qids.tolist(), years.tolist()))
+
+
+def insert_contributions(conn, nodes, item_edges, years):
+    conn.executemany('INSERT INTO item_nodes VALUES (?, ?)', nodes)
+    conn.executemany('INSERT INTO item_edges VALUES (?, ?, ?, ?)', item_edges)
+    conn.executemany('INSERT INTO item_years VALUES (?, ?)', years)
+
+
+def derive_all(conn, item_filter):
+    """derive the graph from every stored item"""
+    with conn:
+        for table in derived_tables:
+            conn.execute('DELETE FROM ' + table)
+        rows = conn.execute('SELECT * FROM items')
+        while True:
+            batch = rows.fetchmany(batch_size)
+            if not batch:
+                break
+            insert_contributions(conn, *contributions(batch, item_filter))
+        conn.execute('''INSERT INTO graph_nodes
+                        SELECT DISTINCT node, year FROM item_nodes
+                        LEFT JOIN item_years ON qid = node''')
+        conn.execute('INSERT OR IGNORE INTO final_edges '
+                     'SELECT src, dst, prop FROM item_edges WHERE ' + is_final)
+        conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                     ('filter', filter_digest(item_filter)))
+
+
+def stored_digest(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'filter'"
+                       ).fetchone()
+    return row and row[0]
+
+
+def refresh(conn, changed, item_filter):
+    """re-derive the graph for the changed entities, looking only at their
+    rows and at the nodes and statements they touch(ed); returns how many
+    nodes and statements were looked at"""
+    sources = [entity_to_int(qid) for qid in changed if is_encodable(qid)]
+    nodes_seen, edges_seen = set(sources), set()
+    with conn:
+        for chunk in chunks(sources):
+            nodes_seen.update(node for node, in conn.execute(
+                'SELECT node FROM item_nodes WHERE source IN (%s)' %
+                marks(chunk), chunk))
+            edges_seen.update(conn.execute(
+                'SELECT src, dst, prop FROM item_edges WHERE source IN (%s)' %
+                marks(chunk), chunk))
+            for table, column in (('item_nodes', 'source'),
+                                  ('item_edges', 'source'),
+                                  ('item_years', 'qid')):
+                conn.execute('DELETE FROM %s WHERE %s IN (%s)' % (
+                    table, column, marks(chunk)), chunk)
+        for chunk in chunks(map(int_to_entity, sources)):
+            nodes, item_edges, years = contributions(conn.execute(
+                'SELECT * FROM items WHERE qid IN (%s)' % marks(chunk),
+                chunk), item_filter)
+            insert_contributions(conn, nodes, item_edges, years)
+            nodes_seen.update(node for _, node in nodes)
+            edges_seen.update((src, dst, prop)
+                              for _, src, prop, dst in item_edges)
+
+        # a node gaining or losing its year can change which of the
+        # statements on it are final
+        for node in nodes_seen:
+            old = conn.execute('SELECT year FROM graph_nodes WHERE qid = ?',
+                               (node,)).fetchone()
+            new = conn.execute('''SELECT year FROM item_nodes
+                                  LEFT JOIN item_years ON qid = node
+                                  WHERE node = ? LIMIT 1''',
+                               (node,)).fetchone()
+            if old == new:
+                continue
+            if new is None:
+                conn.execute('DELETE FROM graph_nodes WHERE qid = ?', (node,))
+            else:
+                conn.execute('INSERT OR REPLACE INTO graph_nodes '
+                             'VALUES (?, ?)', (node, new[0]))
+            if (old is None or old[0] is None) != (new is None or
+                                                   new[0] is None):
+                for column in ('src', 'dst'):
+                    edges_seen.update(conn.execute(
+                        'SELECT src, dst, prop FROM item_edges '
+                        'WHERE %s = ?' % column, (node,)))
+
+        for key in edges_seen:
+            if conn.execute('SELECT 1 FROM item_edges WHERE src = ? AND '
+                            'dst = ? AND prop = ? AND ' + is_final +
+                            ' LIMIT 1', key).fetchone():
+                conn.execute('INSERT OR IGNORE INTO final_edges '
+                             'VALUES (?, ?, ?)', key)
+            else:
+                conn.execute('DELETE FROM final_edges WHERE src = ? AND '
+                             'dst = ? AND prop = ?', key)
+    return len(nodes_seen), len(edges_seen)
+
+
+def write_derived(conn):
+    """stream the graph out of the store, in the formats of wd2cg.py's
+    statements_final.txt, nodes.tsv and relationships.tsv and of the years
+    artifacts.py exports (nodes.tsv is in QID order)"""
+    with open('statements_final.txt', 'w') as statementsfile, \
+            open('relationships.tsv', 'w') as relsfile:
+        relsfile.write('_from\t_to\ttype\n')
+        for src, dst, code in conn.execute('SELECT * FROM final_edges'):
+            src, dst, prop = (int_to_entity(src), int_to_entity(dst),
+                              props[code])
+            statementsfile.write('%s %s %s\n' % (src, prop, dst))
+            relsfile.write('%s\t%s\t%s\n' % (src, dst, prop))
+
+    with open('wd_years.json', 'w') as yearsfile, \
+            open('nodes.tsv', 'w') as nodesfile:
+        nodesfile.write('_key\tname\tlabel\tdate\n')
+        # as json.dumps(years, indent=True) would write it
+        separator = '{'
+        rows = conn.execute('SELECT qid, year FROM graph_nodes')
+        while True:
+            batch = [(int_to_entity(qid), year)
+                     for qid, year in rows.fetchmany(lookup_size)]
+            if not batch:
+                break
+            labels = load_labels(conn, [node for node, _ in batch])
+            for node, year in batch:
+                nodesfile.write('%s\t%s\tArticle\t%s\n' % (
+                    node, labels.get(node, node),
+                    'null' if year is None else year))
+                if year is not None:
+                    yearsfile.write('%s\n %s: %d' % (
+                        separator, json.dumps(node), year))
+                    separator = ','
+        yearsfile.write('{}' if separator == '{' else '\n}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--store', default='wd_state.sqlite',
+                        help='path of the state store')
+    parser.add_argument('--rebuild-filter', action='store_true',
+                        help='rebuild filter.json from the stored P279 edges, '
+                             'instead of using the existing one')
+    parser.add_argument('--decoder', default='auto',
+                        choices=('auto',) + BACKENDS,
+                        help='JSON backend to decode entities with')
+    parser.add_argument('--all-outputs', action='store_true',
+                        help="write all of wd2cg.py's outputs, not just the "
+                             'statements, years and TSVs')
+    commands = parser.add_subparsers(dest='command', required=True)
+    init_parser = commands.add_parser('init', help='build the store from a '
+                                                   'full dump')
+    init_parser.add_argument('dump_path')
+    init_parser.add_argument('--workers', type=int, default=1,
+                             help='number of processes to scan the dump with')
+    update_parser = commands.add_parser('update', help='apply changed '
+                                                       'entities to the store')
+    update_parser.add_argument('changes', nargs='+',
+                               help='files of changed entity JSON lines')
+    args = parser.parse_args()
+
+    metrics = RunMetrics()
+    conn = open_store(args.store)
+    changed = set()
+    if args.command == 'init':
+        with conn:
+            conn.execute('DELETE FROM items')
+            conn.execute('DELETE FROM labels')
+            conn.execute("DELETE FROM meta WHERE key = 'filter'")
+        with metrics.stage('scan'):
+            save_scan(conn, process_dump(
+                args.dump_path, workers=args.workers, decoder=args.decoder,
+                progress=metrics.scan_progress()))
+    else:
+        loads = get_decoder(args.decoder)
+        with metrics.stage('update'):
+            for path in args.changes:
+                with open_dump(path) as infile:
+                    entities = apply_changes(conn, infile, loads)
+                print(path + ':', len(entities), 'entities changed')
+                changed |= entities
+    metrics.count('changed_entities', len(changed))
+
+    with metrics.stage('fiction_filter'):
+        item_filter = store_filter(conn, 'filter.json', args.rebuild_filter)
+    if stored_digest(conn) != filter_digest(item_filter):
+        # a new store, or a different filter
+        with metrics.stage('derive_all'):
+            derive_all(conn, item_filter)
+    else:
+        with metrics.stage('refresh'):
+            nodes_seen, edges_seen = refresh(conn, changed, item_filter)
+        metrics.count('refreshed_nodes', nodes_seen)
+        metrics.count('refreshed_statements', edges_seen)
+
+    if args.all_outputs:
+        with metrics.stage('load_scan'):
+            scan = load_scan(conn)
+            scan.apply_fiction_filter(item_filter)
+            scan.labels = load_labels(conn, scan.nodes)
+        write_outputs(scan, metrics=metrics)
+    else:
+        with metrics.stage('write_derived'):
+            write_derived(conn)
+    metrics.write()
@@ -0,0 +1,62 @@
+"""on-demand label lookup from the label heap in the binary artifacts
+
+Only the labels asked for are read (and cached), so a consumer's memory use
+depends on how many labels it needs, not on how many the dump had."""
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from artifacts import StringHeap, default_dir
+from edges import entity_to_int, is_encodable
+
+
+class LabelStore:
+    """sorted, memory-mapped QID -> label table with an LRU cache in front"""
+
+    def __init__(self, directory=default_dir, cache_size=100000):
+        self.qids = np.load(os.path.join(directory, 'labels_qids.npy'),
+                            mmap_mode='r')
+        self.heap = StringHeap(directory, 'labels')
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+    def __len__(self):
+        return len(self.qids)
+
+    def remember(self, qid, label):
+        self.cache[qid] = label
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def get(self, qid, default=None):
+        return self.get_many([qid]).get(qid, default)
+
+    def get_many(self, qids):
+        """look up a batch of QID strings, returning {QID: label} for the
+        ones that have a label"""
+        result = {}
+        missing = []
+        for qid in qids:
+            if qid in self.cache:
+                self.cache.move_to_end(qid)
+                result[qid] = self.cache[qid]
+            elif is_encodable(qid):
+                missing.append(qid)
+        if not missing or not len(self.qids):
+            return result
+
+        # one vectorised search for every QID that wasn't cached
+        numbers = np.array([entity_to_int(qid) for qid in missing],
+                           dtype='<i8')
+        positions = np.searchsorted(self.qids, numbers)
+        positions[positions == len(self.qids)] = 0
+        found = self.qids[positions] == numbers
+        for qid, position, is_found in zip(missing, positions.tolist(),
+                                           found.tolist()):
+            if is_found:
+                label = self.heap[position]
+                result[qid] = label
+                self.remember(qid, label)
+        return result
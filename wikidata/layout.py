@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+"""time-aware force-directed layout of the graph exported by wd2cg.py (see
+graph_export.py), in place of makengraph.js and ngraph.offline.timelayout
+
+Nodes with a year have their time coordinate pinned to it; everything else
+moves under ngraph-style physics: springs along the links, repulsion
+between nodes and drag.  Repulsion is Barnes-Hut style over the free plane,
+using a hierarchy of grids instead of a quadtree: at every level a node is
+pushed by the centres of mass of the cells that are far enough away at that
+level but weren't at the one above, and by its nearest cells at the finest
+level.  Forces are worked out in chunks of nodes and links on a thread
+pool (NumPy releases the GIL for the heavy lifting).
+
+With --warm-start, nodes keep their positions from the previous release,
+new nodes start next to their neighbours and the layout is only refined,
+which is much quicker and keeps the map looking the same from one release
+to the next.
+
+The output is what ngraph.tobinary and the time layout wrote before:
+
+    labels.json         node QIDs, in node order
+    links.bin           for every node, -(its index + 1) followed by
+                        (index + 1) of each of its targets, int32 LE
+    meta.json           when the layout was made, and its parameters
+    data/positions.bin  x, y, z of every node, int32 LE, in node order"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from graph_export import read_graph
+
+axes = {'x': 0, 'y': 1, 'z': 2}
+max_depth = 11
+# cells within this many cells of each other, at any level, are too close
+# to stand in for their nodes; 2 keeps the error to a few percent
+reach = 2
+span = 2 * reach + 1
+
+
+def grid_depth(node_count):
+    """enough levels that cells at the finest one hold about a node each"""
+    return int(np.clip(np.ceil(np.log2(max(node_count, 1)) / 2) + 1, 2,
+                       max_depth))
+
+
+def spread_bits(values):
+    """put a zero bit in front of each of the (up to 16) bits of values"""
+    values = values & 0xFFFF
+    for shift, mask in ((8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333),
+                        (1, 0x55555555)):
+        values = (values | (values << shift)) & mask
+    return values
+
+
+class CellLevel:
+    """the non-empty cells at one level of the grid hierarchy: which nodes
+    (in Z order, so that every cell's nodes are contiguous) each one holds,
+    their total mass and centre of mass"""
+
+    def __init__(self, cells, keys, plane_x, plane_y, masses, level, depth):
+        shift = depth - level
+        level_keys = keys >> (2 * shift)
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = level_keys[1:] != level_keys[:-1]
+        self.starts = np.flatnonzero(first)
+        self.node_cells = np.cumsum(first) - 1
+        coords = cells[self.starts] >> shift
+        self.width = (1 << level) + 2 * span
+        # where each cell is in the (padded) index grid
+        self.places = (coords[:, 0] + span) * self.width + coords[:, 1] + span
+        self.odd = (coords & 1).astype(bool)
+
+        # an extra, empty cell at the end stands in for the empty ones
+        count = len(self.starts)
+        self.counts = np.zeros(count + 1, dtype=np.int64)
+        self.counts[:-1] = np.diff(np.append(self.starts, len(keys)))
+        self.first_nodes = np.append(self.starts, 0)
+        self.mass = np.zeros(count + 1)
+        self.mass[:-1] = np.add.reduceat(masses, self.starts)
+        self.centre_x = np.zeros(count + 1)
+        self.centre_x[:-1] = (np.add.reduceat(plane_x * masses, self.starts) /
+                              self.mass[:-1])
+        self.centre_y = np.zeros(count + 1)
+        self.centre_y[:-1] = (np.add.reduceat(plane_y * masses, self.starts) /
+                              self.mass[:-1])
+        self.index = np.full(self.width ** 2, count, dtype=np.int32)
+        self.index[self.places] = np.arange(count)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, places, dx, dy):
+        """the cells at an offset from the ones at the given places"""
+        return self.index[places + (dx * self.width + dy)]
+
+
+def build_levels(plane, masses, depth):
+    """sort the nodes into Z order of their cells at the finest level and
+    build every level from there; returns the order, the sorted x, y and
+    masses and the levels"""
+    low = plane.min(axis=0)
+    extent = max(float((plane.max(axis=0) - low).max()), 1.0) * (1 + 1e-9)
+    cells = ((plane - low) * ((1 << depth) / extent)).astype(np.int64)
+    np.clip(cells, 0, (1 << depth) - 1, out=cells)
+    keys = (spread_bits(cells[:, 0]) << 1) | spread_bits(cells[:, 1])
+    order = np.argsort(keys, kind='stable')
+    cells, keys = cells[order], keys[order]
+    plane_x = np.ascontiguousarray(plane[order, 0])
+    plane_y = np.ascontiguousarray(plane[order, 1])
+    masses = masses[order]
+    levels = [None] * (depth + 1)
+    for level in range(2, depth + 1):
+        levels[level] = CellLevel(cells, keys, plane_x, plane_y, masses,
+                                  level, depth)
+    return order, plane_x, plane_y, masses, levels
+
+
+def far_field(level, part, softening):
+    """the repulsion field, and its gradient, at the centres of a chunk of
+    a level's cells, from the cells that are well away from them at this
+    level but weren't at the one above (the children of the parent cell's
+    neighbours, less the cell's own neighbours)
+
+    Returns field x, field y and the gradient's xx, xy and yy."""
+    count = part.stop - part.start
+    result = np.zeros((5, count))
+    for odd_x in (False, True):
+        for odd_y in (False, True):
+            # which offsets those are depends on whether the cell is the
+            # first or second child along each axis
+            members = np.flatnonzero(
+                (level.odd[part, 0] == odd_x) & (level.odd[part, 1] == odd_y))
+            if not len(members):
+                continue
+            members += part.start
+            places = level.places[members]
+            x = level.centre_x[members]
+            y = level.centre_y[members]
+            field_x, field_y, total, bend_xx, bend_xy, bend_yy = (
+                np.zeros(len(members)) for _ in range(6))
+            for dx in range(-2 * reach - odd_x, span - odd_x + 1):
+                for dy in range(-2 * reach - odd_y, span - odd_y + 1):
+                    if abs(dx) <= reach and abs(dy) <= reach:
+                        continue
+                    other = level.lookup(places, dx, dy)
+                    delta_x = x - level.centre_x[other]
+                    delta_y = y - level.centre_y[other]
+                    distance = delta_x * delta_x + delta_y * delta_y
+                    distance += softening
+                    strength = level.mass[other] / (distance *
+                                                    np.sqrt(distance))
+                    field_x += strength * delta_x
+                    field_y += strength * delta_y
+                    total += strength
+                    strength *= 3
+                    strength /= distance
+                    bend_xx += strength * delta_x * delta_x
+                    bend_xy += strength * delta_x * delta_y
+                    bend_yy += strength * delta_y * delta_y
+            rows = members - part.start
+            result[0, rows] = field_x
+            result[1, rows] = field_y
+            result[2, rows] = total - bend_xx
+            result[3, rows] = -bend_xy
+            result[4, rows] = total - bend_yy
+    return result
+
+
+def near_field(finest, plane_x, plane_y, masses, part, softening):
+    """repulsion between every pair of nodes in the same or nearby cells at
+    the finest level, for the nodes in a chunk and the nodes they're paired
+    with (each pair is only counted once, from its first node)
+
+    Returns the x and y forces on every node."""
+    nodes = np.arange(part.start, part.stop)
+    places = finest.places[finest.node_cells[part]]
+    owners = []
+    partners = []
+    for dx in range(0, reach + 1):
+        for dy in range(-reach if dx else 0, reach + 1):
+            other = finest.lookup(places, dx, dy)
+            counts = finest.counts[other]
+            total = int(counts.sum())
+            if not total:
+                continue
+            owner = np.repeat(nodes, counts)
+            partner = np.arange(total) + np.repeat(
+                finest.first_nodes[other] - (np.cumsum(counts) - counts),
+                counts)
+            if dx == 0 and dy == 0:
+                later = partner > owner
+                owner, partner = owner[later], partner[later]
+            owners.append(owner)
+            partners.append(partner)
+    force_x = np.zeros(len(plane_x))
+    force_y = np.zeros(len(plane_x))
+    if not owners:
+        return force_x, force_y
+    owner = np.concatenate(owners)
+    partner = np.concatenate(partners)
+    delta_x = plane_x[owner] - plane_x[partner]
+    delta_y = plane_y[owner] - plane_y[partner]
+    distance = delta_x * delta_x + delta_y * delta_y + softening
+    strength = masses[owner] * masses[partner] / (distance *
+                                                  np.sqrt(distance))
+    push_x = strength * delta_x
+    push_y = strength * delta_y
+    count = len(plane_x)
+    force_x += np.bincount(owner, weights=push_x, minlength=count)
+    force_x -= np.bincount(partner, weights=push_x, minlength=count)
+    force_y += np.bincount(owner, weights=push_y, minlength=count)
+    force_y -= np.bincount(partner, weights=push_y, minlength=count)
+    return force_x, force_y
+
+
+def node_far_field(levels, fields, plane_x, plane_y, masses, part):
+    """the far field of a chunk of nodes' cells at every level, to first
+    order, times their mass"""
+    x = plane_x[part]
+    y = plane_y[part]
+    force_x = np.zeros(len(x))
+    force_y = np.zeros(len(x))
+    for level, field in zip(levels[2:], fields[2:]):
+        cell = level.node_cells[part]
+        delta_x = x - level.centre_x[cell]
+        delta_y = y - level.centre_y[cell]
+        field_x, field_y, slope_xx, slope_xy, slope_yy = field[:, cell]
+        force_x += field_x + slope_xx * delta_x + slope_xy * delta_y
+        force_y += field_y + slope_xy * delta_x + slope_yy * delta_y
+    return force_x * masses[part], force_y * masses[part]
+
+
+def repulsion(plane, masses, depth, softening, pool, chunk_size):
+    """Barnes-Hut style repulsion (per unit of charge) on every node in the
+    plane, worked out in chunks on the thread pool"""
+    order, plane_x, plane_y, masses, levels = build_levels(plane, masses,
+                                                           depth)
+    fields = [None] * (depth + 1)
+    for level in range(2, depth + 1):
+        fields[level] = np.concatenate(list(pool.map(
+            lambda part: far_field(levels[level], part, softening),
+            chunks(len(levels[level]), chunk_size))), axis=1)
+
+    node_parts = chunks(len(plane), chunk_size)
+    far = list(pool.map(
+        lambda part: node_far_field(levels, fields, plane_x, plane_y, masses,
+                                    part), node_parts))
+    force_x = np.concatenate([part_x for part_x, _ in far])
+    force_y = np.concatenate([part_y for _, part_y in far])
+    for near_x, near_y in pool.map(
+            lambda part: near_field(levels[depth], plane_x, plane_y, masses,
+                                    part, softening),
+            chunks(len(plane), max(chunk_size, len(plane) // 8 + 1))):
+        force_x += near_x
+        force_y += near_y
+
+    force = np.empty_like(plane)
+    force[order, 0] = force_x
+    force[order, 1] = force_y
+    return force
+
+
+def spring_forces(positions, sources, targets, length, coeff):
+    """ngraph's spring force for a chunk of links, summed per node"""
+    delta = positions[targets] - positions[sources]
+    distance = np.sqrt((delta * delta).sum(axis=1))
+    distance[distance == 0] = 1e-3
+    pull = delta * (coeff * (distance - length) / distance)[:, None]
+    force = np.empty_like(positions)
+    for axis in range(3):
+        force[:, axis] = (
+            np.bincount(sources, weights=pull[:, axis],
+                        minlength=len(positions)) -
+            np.bincount(targets, weights=pull[:, axis],
+                        minlength=len(positions)))
+    return force
+
+
+def chunks(count, size):
+    return [slice(start, min(start + size, count))
+            for start in range(0, count, size)]
+
+
+class TimeLayout:
+    """positions and velocities of every node, and the physics settings"""
+
+    def __init__(self, links, years, dated, time_axis='y', max_time=None,
+                 year_scale=10.0, spring_length=30.0, spring_coeff=0.0008,
+                 charge=1.2, drag=0.02, time_step=20.0, threads=None,
+                 chunk_size=1 << 18, seed=0):
+        self.node_count = len(years)
+        self.sources = links['from'].astype(np.int64)
+        self.targets = links['to'].astype(np.int64)
+        self.years = years
+        self.dated = dated
+        self.time_axis = axes[time_axis]
+        self.free_axes = [axis for axis in range(3)
+                          if axis != self.time_axis]
+        self.max_time = (datetime.date.today().year if max_time is None
+                         else max_time)
+        self.year_scale = year_scale
+        self.spring_length = spring_length
+        self.spring_coeff = spring_coeff
+        self.charge = charge
+        self.drag = drag
+        self.time_step = time_step
+        self.chunk_size = chunk_size
+        self.softening = (spring_length / 10) ** 2
+        self.depth = grid_depth(self.node_count)
+        self.pool = ThreadPoolExecutor(threads or os.cpu_count())
+        self.rng = np.random.default_rng(seed)
+
+        # ngraph's body mass
+        degree = (np.bincount(self.sources, minlength=self.node_count) +
+                  np.bincount(self.targets, minlength=self.node_count))
+        self.masses = 1 + degree / 3
+        self.positions = np.zeros((self.node_count, 3))
+        self.velocities = np.zeros((self.node_count, 3))
+        self.place(np.ones(self.node_count, dtype=bool))
+
+    def year_position(self, years):
+        return (years - self.max_time) * self.year_scale
+
+    def neighbour_mean(self, values, known):
+        """the average of values over each node's known neighbours, and
+        whether it has any"""
+        weight = np.zeros(self.node_count)
+        total = np.zeros(self.node_count)
+        for ends, others in ((self.sources, self.targets),
+                             (self.targets, self.sources)):
+            weight += np.bincount(ends, weights=known[others],
+                                  minlength=self.node_count)
+            total += np.bincount(ends, weights=values[others] * known[others],
+                                 minlength=self.node_count)
+        has = weight > 0
+        return np.where(has, total / np.maximum(weight, 1), 0), has
+
+    def place(self, new, rounds=3):
+        """put new nodes near their placed neighbours, going a few rounds
+        out so that new nodes only linked to new nodes get placed too, or
+        failing that at a random spot in the plane; on the time axis they go
+        at their year, or their neighbours' average time"""
+        time_known = self.dated | ~new
+        plane_known = ~new
+        times = self.positions[:, self.time_axis].copy()
+        times[self.dated] = self.year_position(self.years[self.dated])
+        plane = self.positions[:, self.free_axes].copy()
+        for _ in range(rounds):
+            mean, has = self.neighbour_mean(times, time_known)
+            placing = has & ~time_known
+            times[placing] = mean[placing]
+            time_known |= placing
+
+            placing = ~plane_known
+            for column in range(2):
+                mean, has = self.neighbour_mean(plane[:, column], plane_known)
+                placing &= has
+                plane[placing, column] = mean[placing]
+            plane[placing] += self.rng.normal(0, self.spring_length,
+                                              (int(placing.sum()), 2))
+            plane_known |= placing
+
+        spread = self.spring_length * np.sqrt(self.node_count) / 4
+        unplaced = ~plane_known
+        if plane_known.any():
+            centre = plane[plane_known].mean(axis=0)
+            spread = max(spread, float(plane[plane_known].std()))
+        else:
+            centre = 0
+        plane[unplaced] = centre + self.rng.normal(
+            0, spread, (int(unplaced.sum()), 2))
+        times[~time_known] = 0
+        self.positions[:, self.time_axis] = times
+        self.positions[:, self.free_axes] = plane
+
+    def warm_start(self, ids, previous_ids, previous_positions):
+        """take the positions of nodes that were in a previous layout,
+        placing the rest near them; returns how many were kept"""
+        previous = {qid: i for i, qid in enumerate(previous_ids)}
+        found = np.array([qid in previous for qid in ids], dtype=bool)
+        rows = [previous[qid] for qid in ids if qid in previous]
+        self.positions[found] = previous_positions[rows]
+        self.velocities[:] = 0
+        # dated nodes go back to their year in place(), in case the years
+        # (or the year scale) have changed since
+        self.place(~found)
+        return int(found.sum())
+
+    def forces(self):
+        plane = self.positions[:, self.free_axes]
+        push = repulsion(plane, self.masses, self.depth, self.softening,
+                         self.pool, self.chunk_size) * self.charge
+        force = np.zeros_like(self.positions)
+        force[:, self.free_axes] = push
+
+        def pull(part):
+            return spring_forces(self.positions, self.sources[part],
+                                 self.targets[part], self.spring_length,
+                                 self.spring_coeff)
+
+        for part_force in self.pool.map(
+                pull, chunks(len(self.sources), self.chunk_size * 4)):
+            force += part_force
+        return force - self.drag * self.velocities
+
+    def step(self, max_speed=1.0):
+        """one step of ngraph's Euler integration, with its speed limit
+        (of 1) lowered to max_speed; returns the mean movement"""
+        force = self.forces()
+        self.velocities += force * (self.time_step / self.masses)[:, None]
+        self.velocities[self.dated, self.time_axis] = 0
+        speed = np.sqrt((self.velocities ** 2).sum(axis=1))
+        too_fast = speed > max_speed
+        self.velocities[too_fast] *= (max_speed / speed[too_fast])[:, None]
+        movement = self.velocities * self.time_step
+        self.positions += movement
+        return float(np.sqrt((movement ** 2).sum(axis=1)).mean())
+
+    def run(self, iterations, start_speed=1.0, end_speed=0.02,
+            report_each=50):
+        """run the layout, cooling it down: ngraph's fixed speed limit keeps
+        most nodes jumping back and forth by a whole time step forever, so
+        the limit is lowered geometrically from start_speed to end_speed"""
+        start = time.time()
+        cooling = (end_speed / start_speed) ** (1 / max(iterations - 1, 1))
+        for iteration in range(1, iterations + 1):
+            movement = self.step(start_speed * cooling ** (iteration - 1))
+            if iteration % report_each == 0 or iteration == iterations:
+                print('layout: iteration %d/%d, mean movement %.2f, %.0fs' % (
+                    iteration, iterations, movement, time.time() - start))
+
+    def settings(self):
+        return {'timeAxis': 'xyz'[self.time_axis], 'maxTime': self.max_time,
+                'yearScale': self.year_scale,
+                'springLength': self.spring_length,
+                'springCoeff': self.spring_coeff, 'charge': self.charge,
+                'drag': self.drag, 'timeStep': self.time_step}
+
+
+def write_links(path, links, node_count):
+    """write links.bin the way ngraph.tobinary does, with a record for
+    every node, linked or not"""
+    order = np.argsort(links['from'], kind='stable')
+    sources = links['from'][order].astype(np.int64)
+    targets = links['to'][order].astype(np.int64)
+    counts = np.bincount(sources, minlength=node_count)
+    # each node's record starts after those of the nodes (and links) before
+    starts = np.arange(node_count)
+    starts[1:] += np.cumsum(counts)[:-1]
+    records = np.empty(len(sources) + node_count, dtype='<i4')
+    records[starts] = -(np.arange(node_count) + 1)
+    records[np.arange(len(sources)) + sources + 1] = targets + 1
+    records.tofile(path)
+
+
+def read_positions(path):
+    return np.fromfile(path, dtype='<i4').reshape(-1, 3).astype(float)
+
+
+def read_previous(directory):
+    """the node QIDs, positions and layout settings (None if it doesn't
+    say) of an earlier layout: either an output directory of this script
+    or a release directory that cg.sh made from one, where positions.bin is
+    at the top and the labels are fix_labels.py's "label - QID" ones"""
+    with open(os.path.join(directory, 'labels.json')) as labelsfile:
+        ids = [label.rsplit(' ', 1)[-1]
+               for label in json.loads(labelsfile.read())]
+    positions_path = os.path.join(directory, 'positions.bin')
+    if not os.path.exists(positions_path):
+        positions_path = os.path.join(directory, 'data', 'positions.bin')
+    positions = read_positions(positions_path)
+    settings = None
+    meta_path = os.path.join(directory, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path) as metafile:
+            settings = json.loads(metafile.read()).get('layout')
+    if len(ids) != len(positions):
+        raise ValueError('%s has %d labels but %d positions' % (
+            directory, len(ids), len(positions)))
+    return ids, positions, settings
+
+
+def write_layout(layout, ids, links, out_dir='.'):
+    os.makedirs(os.path.join(out_dir, 'data'), exist_ok=True)
+    with open(os.path.join(out_dir, 'labels.json'), 'w') as labelsfile:
+        labelsfile.write(json.dumps(ids))
+    write_links(os.path.join(out_dir, 'links.bin'), links, len(ids))
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as metafile:
+        metafile.write(json.dumps({'date': int(time.time() * 1000),
+                                   'nodeFile': 'labels.json',
+                                   'linkFile': 'links.bin',
+                                   'layout': layout.settings()}))
+    np.rint(layout.positions).astype('<i4').tofile(
+        os.path.join(out_dir, 'data', 'positions.bin'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', default='graph_nodes.json')
+    parser.add_argument('--links', default='graph_links.bin')
+    parser.add_argument('--out-dir', default='.')
+    parser.add_argument('--iterations', type=int, default=None,
+                        help='default: 1000, or 100 when warm starting')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='default: one per core')
+    parser.add_argument('--time-axis', choices=sorted(axes), default='y')
+    parser.add_argument('--year-scale', type=float, default=10.0,
+                        help='distance along the time axis per year')
+    parser.add_argument('--max-time', type=int, default=None,
+                        help='year at 0 on the time axis (default: this '
+                             'year)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warm-start', metavar='DIR',
+                        help='start from the layout in DIR (an earlier '
+                             "run's output or a release directory), only "
+                             'refining it')
+    parser.add_argument('--warm-speed', type=float, default=0.1,
+                        help='speed limit to start a warm-started layout at '
+                             '(a cold one starts at 1)')
+    args = parser.parse_args()
+
+    ids, years, dated, link_types, links = read_graph(args.nodes, args.links)
+    layout = TimeLayout(links, years, dated, time_axis=args.time_axis,
+                        max_time=args.max_time, year_scale=args.year_scale,
+                        threads=args.threads, seed=args.seed)
+    print('layout: %d nodes (%d dated), %d links, %d grid levels' % (
+        len(ids), dated.sum(), len(links), layout.depth))
+    iterations, start_speed = args.iterations or 1000, 1.0
+    if args.warm_start:
+        previous_ids, previous_positions, settings = read_previous(
+            args.warm_start)
+        if settings and settings['timeAxis'] != args.time_axis:
+            print('layout: %s has a different time axis, starting cold' %
+                  args.warm_start)
+        else:
+            kept = layout.warm_start(ids, previous_ids, previous_positions)
+            print('layout: warm start from %s kept %d/%d positions' % (
+                args.warm_start, kept, len(ids)))
+            iterations, start_speed = args.iterations or 100, args.warm_speed
+    layout.run(iterations, start_speed=start_speed)
+    write_layout(layout, ids, links, args.out_dir)
@@ -1,24 +1,31 @@
 fs = require('fs')
-dot = require('ngraph.fromdot')
+createGraph = require('ngraph.graph')
 ser = require('ngraph.serialization/json')
-start_years = require('./wd_years.json')
 createLayout = require('ngraph.offline.timelayout')
 save = require('ngraph.tobinary')
 
-graphstr = fs.readFileSync('nxcg.dot', 'utf-8')
-graph = dot(graphstr)
+// written by graph_export.py; see there for the format
+nodes = JSON.parse(fs.readFileSync('graph_nodes.json', 'utf-8'))
+links = fs.readFileSync('graph_links.bin')
+LINK_SIZE = 9
 
+graph = createGraph()
 year_present_count = 0
-total = 0
-graph.forEachNode(function (node) {
-    if (node['id'] in start_years) {
-        node.data = start_years[node['id']]
+nodes.ids.forEach(function (id, i) {
+    if (nodes.years[i] !== null) {
+        graph.addNode(id, nodes.years[i])
         year_present_count += 1
+    } else {
+        graph.addNode(id)
     }
-    total += 1
 })
+for (offset = 0; offset < links.length; offset += LINK_SIZE) {
+    graph.addLink(nodes.ids[links.readInt32LE(offset)],
+                  nodes.ids[links.readInt32LE(offset + 4)],
+                  {type: nodes.linkTypes[links.readUInt8(offset + 8)]})
+}
 console.log("makengraph: start dates present for " + year_present_count + "/" +
-    total)
+    nodes.ids.length)
 
 graph_json = ser.save(graph)
 fs.writeFileSync('ngraph_with_dates.json', graph_json, 'utf8')
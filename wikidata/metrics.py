@@ -0,0 +1,124 @@
+"""timings, throughput and memory use of a pipeline run, for a JSON run
+summary (run_summary.json) that can be compared from one week to the next
+
+Stages are timed with `with metrics.stage('name'):`; each records its wall
+and CPU time and the peak RSS so far.  The scan reports its progress
+through scan_progress(), which prints entities/s and MB/s as it goes.
+cProfile and tracemalloc can be switched on for the whole run; they only
+see the main process, not the scan's workers."""
+
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def peak_rss():
+    """peak resident set size in bytes of this process and of its largest
+    finished child (e.g. a scan worker)"""
+    # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        'children':
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+def prop_counts(codes, names):
+    """{property name: count} from an array of property codes"""
+    counts = np.bincount(codes, minlength=len(names)).tolist()
+    return {names[code]: count for code, count in enumerate(counts) if count}
+
+
+class RunMetrics:
+    """collects the numbers for a run summary"""
+
+    def __init__(self, profile_path=None, trace_top=0):
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.start_time = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+        self.scan = {}
+        self.profile_path = profile_path
+        self.profiler = None
+        self.trace_top = trace_top
+        if profile_path:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if trace_top:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        print('%s: starting' % name, flush=True)
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self.stages[name] = {'seconds': round(wall, 3),
+                                 'cpu_seconds': round(cpu, 3),
+                                 'peak_rss': peak_rss()}
+            print('%s: %.1f s' % (name, wall), flush=True)
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def scan_progress(self, interval=60):
+        """a callback for process_dump() that prints the scan's progress
+        every `interval` seconds and keeps its overall throughput"""
+        start = time.perf_counter()
+        last = [start]
+
+        def progress(offset, entities):
+            now = time.perf_counter()
+            elapsed = max(now - start, 1e-9)
+            self.scan = {'bytes': offset, 'entities': entities,
+                         'seconds': round(elapsed, 3),
+                         'bytes_per_second': round(offset / elapsed),
+                         'entities_per_second': round(entities / elapsed)}
+            if now - last[0] >= interval:
+                last[0] = now
+                print('scanned %.2f GB, %d entities: %.1f MB/s, %d '
+                      'entities/s' % (offset / 1e9, entities,
+                                      offset / elapsed / 1e6,
+                                      entities / elapsed), flush=True)
+        return progress
+
+    def summary(self):
+        summary = {
+            'started': self.started.isoformat(),
+            'seconds': round(time.perf_counter() - self.start_time, 3),
+            'argv': sys.argv,
+            'stages': self.stages,
+            'scan': self.scan,
+            'peak_rss': peak_rss(),
+            'counts': self.counts,
+        }
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+            summary['profile'] = os.path.abspath(self.profile_path)
+        if self.trace_top:
+            snapshot = tracemalloc.take_snapshot()
+            _, traced_peak = tracemalloc.get_traced_memory()
+            summary['tracemalloc'] = {
+                'peak': traced_peak,
+                'top': [{'where': str(stat.traceback), 'size': stat.size,
+                         'count': stat.count} for stat in
+                        snapshot.statistics('lineno')[:self.trace_top]]}
+            tracemalloc.stop()
+        return summary
+
+    def write(self, path='run_summary.json'):
+        with open(path, 'w') as outfile:
+            outfile.write(json.dumps(self.summary(), indent=1))
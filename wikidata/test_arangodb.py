@@ -0,0 +1,127 @@
+"""arangodb.py against a local stub of ArangoDB's HTTP API that records the
+requests it gets"""
+
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from arangodb import ArangoLoader
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """just enough of /_api/collection, /_api/import and /_api/document to
+    keep collections in memory"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, result):
+        data = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def respond(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = {key: values[0] for key, values in
+                  urllib.parse.parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, url.path, params, body))
+            if url.path.endswith('/_api/collection'):
+                name = json.loads(body)['name']
+                if name in server.collections:
+                    return self.reply(409, {'error': True,
+                                            'errorMessage': 'duplicate'})
+                server.collections[name] = {}
+                return self.reply(200, {'name': name})
+            if url.path.endswith('/_api/import'):
+                documents = server.collections[params['collection']]
+                counts = {'created': 0, 'updated': 0, 'errors': 0}
+                for line in body.splitlines():
+                    document = json.loads(line)
+                    counts['updated' if document['_key'] in documents
+                           else 'created'] += 1
+                    documents[document['_key']] = document
+                return self.reply(201, dict(counts, error=False))
+            if '/_api/document/' in url.path:
+                documents = server.collections[url.path.rsplit('/', 1)[1]]
+                results = []
+                for key in json.loads(body):
+                    if documents.pop(key, None) is None:
+                        results.append({'error': True, 'errorNum': 1202})
+                    else:
+                        results.append({'_key': key})
+                return self.reply(200, results)
+        self.reply(404, {'error': True, 'errorMessage': 'unknown path'})
+
+    do_POST = do_DELETE = respond
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.collections = {}
+    server.url = 'http://127.0.0.1:%d' % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def documents(count, version=0):
+    return [{'_key': 'Q%d' % number, 'name': 'item %d' % number,
+             'version': version} for number in range(count)]
+
+
+def loader(stub, tmp_path):
+    return ArangoLoader(stub.url, workers=3, batch_size=10,
+                        manifest_dir=str(tmp_path / 'manifest'))
+
+
+def test_full_load(stub, tmp_path):
+    stats = loader(stub, tmp_path).load('items', iter(documents(25)))
+    assert stats['created'] == 25 and stats['documents'] == 25
+    assert stub.collections['items'] == {document['_key']: document
+                                         for document in documents(25)}
+    imports = [request for request in stub.requests
+               if request[1].endswith('/_api/import')]
+    assert len(imports) == 3
+    assert all(request[2]['onDuplicate'] == 'replace'
+               for request in imports)
+
+
+def test_unchanged_rerun_sends_nothing(stub, tmp_path):
+    loader(stub, tmp_path).load('items', iter(documents(25)))
+    del stub.requests[:]
+    stats = loader(stub, tmp_path).load('items', iter(documents(25)))
+    assert stub.requests == []
+    assert stats['unchanged'] == 25 and stats['created'] == 0
+
+
+def test_delta_load(stub, tmp_path):
+    loader(stub, tmp_path).load('items', iter(documents(25)))
+    del stub.requests[:]
+    # Q0-Q4 are gone, Q5-Q9 changed, Q10-Q24 are as they were and Q25-Q29
+    # are new
+    changed = documents(10, version=1)[5:]
+    new = documents(30)[10:]
+    stats = loader(stub, tmp_path).load('items', iter(changed + new))
+    assert (stats['updated'], stats['created'], stats['removed'],
+            stats['unchanged']) == (5, 5, 5, 15)
+    sent = [json.loads(line)['_key'] for _, path, _, body in stub.requests
+            if path.endswith('/_api/import') for line in body.splitlines()]
+    assert sorted(sent) == sorted(document['_key'] for document in
+                                  changed + documents(30)[25:])
+    assert stub.collections['items'] == {document['_key']: document
+                                         for document in changed + new}
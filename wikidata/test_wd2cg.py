@@ -0,0 +1,63 @@
+"""write_outputs() on dumps with few or no dates"""
+
+import json
+
+from dates import DateBuffer, year_vectors
+from wd2cg import write_outputs
+from wd_scan import process_dump
+
+gregorian = 'http://www.wikidata.org/entity/Q1985727'
+
+
+def claim(prop, datavalue):
+    return {'mainsnak': {'snaktype': 'value', 'property': prop,
+                         'datavalue': datavalue},
+            'type': 'statement', 'rank': 'normal'}
+
+
+def birth(year):
+    return claim('P569', {'type': 'time', 'value': {
+        'time': '+%04d-01-01T00:00:00Z' % year, 'precision': 11,
+        'calendarmodel': gregorian}})
+
+
+def influence(qid):
+    return claim('P737', {'type': 'wikibase-entityid', 'value': {
+        'entity-type': 'item', 'numeric-id': int(qid[1:]), 'id': qid}})
+
+
+def item(qid, claims):
+    return {'type': 'item', 'id': qid,
+            'labels': {'en': {'language': 'en', 'value': 'item ' + qid}},
+            'claims': {prop: [claim] for prop, claim in claims}}
+
+
+def run(tmp_path, monkeypatch, entities):
+    """scan a dump of `entities` and write the outputs in tmp_path,
+    returning graph_nodes.json"""
+    dump_path = tmp_path / 'dump.json'
+    dump_path.write_text('[\n' + ',\n'.join(map(json.dumps, entities)) +
+                         '\n]\n')
+    monkeypatch.chdir(tmp_path)
+    write_outputs(process_dump(str(dump_path), frozenset()))
+    return json.loads((tmp_path / 'graph_nodes.json').read_text())
+
+
+def test_year_vectors_without_dates():
+    for qids, years in year_vectors(DateBuffer().to_array()).values():
+        assert len(qids) == len(years) == 0
+
+
+def test_empty_dump(tmp_path, monkeypatch):
+    assert run(tmp_path, monkeypatch, [])['ids'] == []
+    assert (tmp_path / 'statements_final.txt').read_text() == ''
+
+
+def test_start_dates_only(tmp_path, monkeypatch):
+    # births are start dates, and nothing has an end date
+    nodes = run(tmp_path, monkeypatch, [
+        item('Q1', [('P569', birth(1900)), ('P737', influence('Q2'))]),
+        item('Q2', [('P569', birth(1850))]),
+    ])
+    assert dict(zip(nodes['ids'], nodes['years'])) == {'Q1': 1900,
+                                                       'Q2': 1850}
@@ -0,0 +1,34 @@
+"""applying the fiction filter after the scan, as --rebuild-filter does,
+against applying it during the scan"""
+
+import numpy as np
+
+from build_fiction_filter import fiction_closure
+from edges import int_to_entity
+from gen_dump import write_dump
+from wd_scan import process_dump
+
+
+def test_filter_after_scan_matches_filter_during_scan(tmp_path):
+    dump_path = str(tmp_path / 'dump.json')
+    write_dump(dump_path, 10000, seed=1)
+    unfiltered = process_dump(dump_path)
+    fiction_filter = frozenset(fiction_closure(unfiltered.subclass_edges))
+    # only the items that brought statements or dates keep their classes
+    contributed = np.union1d(unfiltered.statements.to_array()['src'],
+                             unfiltered.dates.to_array()['qid'])
+    contributors = (unfiltered.cg_subjects |
+                    set(map(int_to_entity, contributed.tolist())))
+    assert unfiltered.class_claims
+    assert set(unfiltered.class_claims) <= contributors
+    statement_count = len(unfiltered.statements)
+    unfiltered.apply_fiction_filter(fiction_filter)
+    # some fictional items' statements were dropped
+    assert len(unfiltered.statements) < statement_count
+    filtered = process_dump(dump_path, fiction_filter)
+
+    assert unfiltered.nodes == filtered.nodes
+    for buffer in ('statements', 'dates'):
+        after = getattr(unfiltered, buffer).to_array()
+        during = getattr(filtered, buffer).to_array()
+        assert np.array_equal(np.sort(after), np.sort(during))
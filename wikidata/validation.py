@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""data-quality checks run on the pipeline's columnar data, written to one
+report file (validation_report.json)
+
+- back edges: statements whose source starts more than a relation's
+  threshold of years after its target, which usually means a wrong date or
+  a property used the wrong way round
+- month/day dates: dates whose "year" is 1-31, with a month but no day,
+  which are likely a day and month that Wikidata stored as month and year
+
+back_edge_finder.py and date_flagger.py run the same checks on the
+artifacts of an earlier run."""
+
+import argparse
+from collections import Counter
+
+import numpy as np
+
+from artifacts import Artifacts, default_dir
+from dates import date_props, format_date, unpack_dates
+from edges import int_to_entity, lookup_years, prop_codes, props
+from graph_report import write_report
+
+excluded_rels = ['P31', 'P279', 'P61i']
+default_threshold = 1000
+
+
+def back_edges(edges, year_table, thresholds=None,
+               threshold=default_threshold):
+    """statements whose source's year is more than the threshold for their
+    relation (thresholds[prop], or threshold) after their target's, as
+    [source, year, property, target, year] lists"""
+    thresholds = thresholds or {}
+    limits = np.array([thresholds.get(prop, threshold) for prop in props])
+    excluded = np.isin(edges['prop'], [prop_codes[rel] for rel in
+                                       excluded_rels if rel in prop_codes])
+    src_years, src_dated = lookup_years(year_table, edges['src'])
+    dst_years, dst_dated = lookup_years(year_table, edges['dst'])
+    back = (src_dated & dst_dated & ~excluded &
+            (src_years - dst_years > limits[edges['prop']]))
+    return [[int_to_entity(src), src_year, props[prop], int_to_entity(dst),
+             dst_year]
+            for src, src_year, prop, dst, dst_year in zip(
+                edges['src'][back].tolist(), src_years[back].tolist(),
+                edges['prop'][back].tolist(), edges['dst'][back].tolist(),
+                dst_years[back].tolist())]
+
+
+def monthday_dates(dates):
+    """the [QID, property, date] claims (from an array of dates.date_dtype
+    records) whose date is likely a month/day entered by a user, but stored
+    as a month/year by Wikidata"""
+    years, months, days, _, _ = unpack_dates(dates['date'])
+    flagged = ((years >= 1) & (years <= 31) & (months >= 1) &
+               (months <= 12) & (days == 0))
+    return [[int_to_entity(qid), date_props[prop], format_date(date)]
+            for qid, prop, date in dates[flagged].tolist()]
+
+
+def validate(edges, year_table, dates, thresholds=None,
+             threshold=default_threshold):
+    found_edges = back_edges(edges, year_table, thresholds, threshold)
+    found_dates = monthday_dates(dates)
+    return {
+        'back_edges': {
+            'threshold': threshold, 'thresholds': thresholds or {},
+            'counts': dict(Counter(edge[2] for edge in found_edges)),
+            'statements': found_edges},
+        'monthday_dates': {'count': len(found_dates), 'claims': found_dates},
+    }
+
+
+def parse_thresholds(values):
+    """['P737i=200', ...] -> {'P737i': 200, ...}"""
+    thresholds = {}
+    for value in values:
+        prop, years = value.split('=')
+        thresholds[prop] = int(years)
+    return thresholds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', nargs='?', default=default_dir)
+    parser.add_argument('--out', default='validation_report.json')
+    parser.add_argument('--threshold', type=int, default=default_threshold,
+                        help='years a back edge has to go back to be flagged')
+    parser.add_argument('--relation-threshold', nargs='*', default=[],
+                        metavar='PROP=YEARS',
+                        help='a different threshold for some relations')
+    args = parser.parse_args()
+
+    artifacts = Artifacts(args.directory)
+    report = validate(artifacts.edges, artifacts.years,
+                      artifacts.load_dates(),
+                      parse_thresholds(args.relation_threshold),
+                      args.threshold)
+    write_report(report, args.out)
+    print(report['back_edges']['counts'], report['monthday_dates']['count'])
@@ -1,171 +1,48 @@
 #!/usr/bin/env python3
 """make causegraph based on wikidata JSON dump"""
 
+import argparse
 import json
+import os
 import pprint
-import sys
-from collections import Counter
-
-import networkx as nx
-from networkx.drawing.nx_pydot import write_dot
-
-from wd_constants import (all_times, cg_rels, times_plus_nested,
-                          combined_inverses, lang_order, likely_nonspecific)
-
-
-def get_label(obj):
-    """get appropriate label, using language fallback chain"""
-    has_sitelinks = 'sitelinks' in obj
-    for lang in lang_order:
-        site = lang + 'wiki'
-        if has_sitelinks and site in obj['sitelinks']:
-            return obj['sitelinks'][site]['title']
-        elif lang in obj['labels']:
-            return obj['labels'][lang]['value']
-    return None
-
-
-def get_date_claims(claims, props):
-    """get date claims in the specified collection of properties"""
-    result = []
-    for claim in claims:
-        if claim in props:
-            for spec in claims[claim]:
-                if 'time' in spec['mainsnak'].get('datavalue', {}).get(
-                        'value', {}):
-                    date = spec['mainsnak']['datavalue']['value']['time']
-                    result.append([claim, date])
-    return result
-
-
-# (though I'll have to get more precise in the future, for modern-day stuff)
-def dates_to_years(claims):
-    """grab usable years from wikidata dates, to inform CauseGraph layout"""
-    years = {}
-    for item in claims:
-        earliest_year = sys.maxsize
-        for c in claims[item]:
-            try:
-                # example date: March 15, 44 BCE (ignoring calendar issues)
-                # '-44-03-15T00:00:00Z'
-                # so split on '-' (but only the two on the right, so rsplit 2)
-                # and take the first
-                year = int(c[1].rsplit('-', 2)[0])
-                if year < earliest_year:
-                    earliest_year = year
-            except Exception as e:
-                print("error on", item, '-', e.message)
-        if earliest_year < 10000 and earliest_year > -10000:
-            years[item] = earliest_year
-    return years
-
-
-def is_real(qid, claims, fiction_filter):
-    """check for claims that an item is fictional"""
-    if 'P31' in claims:
-        for spec in claims['P31']:
-            if 'id' in spec['mainsnak'].get('datavalue', {}).get('value', {}):
-                thing = spec['mainsnak']['datavalue']['value']['id']
-                if thing in fiction_filter:
-                    return False
-    elif 'P279' in claims:
-        for spec in claims['P279']:
-            if 'id' in spec['mainsnak'].get('datavalue', {}).get('value', {}):
-                thing = spec['mainsnak']['datavalue']['value']['id']
-                if thing in fiction_filter and qid not in fiction_filter:
-                    print("new fictional class:", qid)
-                    return False
-
-    # we don't actually know it's real, but it isn't labeled as fictional
-    return True
-
-
-def check_claims(qid, claim, claim_set):
-    spec_stmts = []
-    other_qids = []
-    for spec in claim_set:
-        if 'id' in spec['mainsnak'].get('datavalue', {}).get('value', {}):
-            other_qid = spec['mainsnak']['datavalue']['value']['id']
-            other_qids.append(other_qid)
-            spec_stmts.append(qid + ' ' + claim + ' ' + other_qid)
-    return spec_stmts, other_qids
-
-
-def check_nested_dates(claim, claim_set):
-    result = []
-    for spec in claim_set:
-        qualifiers = spec.get('qualifiers', {})
-        for qualifier in qualifiers:
-            if qualifier in all_times:
-                for item in qualifiers[qualifier]:
-                    if 'time' in item.get('datavalue', {}).get('value', {}):
-                        date = item['datavalue']['value']['time']
-                        result.append([claim + ' ' + qualifier, date])
-
-    return result
-
-
-def process_dump(dump_path, fiction_filter):
-    nodes = set()
-    date_claims = {}
-    labels = {}
-    statements = []
-
-    # collect statements of interest
-    # TODO refactor this - it's too complex
-    with open(dump_path) as infile:
-        infile.readline()
-        for line in infile:
-            try:
-                obj = json.loads(line.rstrip(',\n'))
-                qid = obj['id']
-
-                if qid not in labels:
-                    obj_label = get_label(obj)
-                    if obj_label is not None:
-                        labels[qid] = obj_label
-
-                is_item = obj['type'] == 'item'
-                real_claims = 'claims' in obj and is_real(qid, obj['claims'], fiction_filter)
-                if is_item and real_claims:
-                    claims = obj['claims']
-                    cg_rel_claims = [c for c in claims if c in cg_rels]
-                    item_dates = [c for c in claims if c in all_times]
-                    nested_date_claims = [c for c in claims if
-                                          c in times_plus_nested]
-
-                    if cg_rel_claims:
-                        nodes.add(qid)
-                    if item_dates and (qid not in date_claims):
-                        # date_claims[qid] = get_date_claims(claims, all_times)
-                        main_date_claims = get_date_claims(claims, all_times)
-                    else:
-                        main_date_claims = []
-
-                    for claim in cg_rel_claims:
-                        spec_stmts, other_qids = check_claims(
-                            qid, claim, claims[claim])
-                        nodes.update(other_qids)
-                        statements += spec_stmts
-
-                    nested_dates = []
-                    for claim in nested_date_claims:
-                        nested_dates += check_nested_dates(claim, claims[claim])
-
-                    date_claims[qid] = main_date_claims + nested_dates
-            except Exception as e:
-                if line != ']\n':
-                    print("*** Exception",
-                          type(e), "-", e.message, "on following line:")
-                    print(line)
-
-    return nodes, date_claims, labels, statements
+import shutil
+import tempfile
+
+import numpy as np
+
+import edges
+import validation
+from arangodb import ArangoLoader, default_url, load_graph
+from artifacts import default_dir, write_artifacts
+from build_fiction_filter import fiction_closure, write_filter
+from dates import date_props, year_vectors
+from decoders import BACKENDS
+from edges import edges_to_strings, int_to_entity, props
+from graph_export import export_graph
+from graph_report import graph_report, summarise, write_report
+from metrics import RunMetrics, prop_counts
+from wd_scan import process_dump
+
+label_batch_size = 100000
+
+
+def node_years(dates, nodes):
+    """year table of the graph's nodes, each dated by the earliest year of
+    any of its dates, to inform CauseGraph layout (items dated outside
+    -10000..10000 are left out)"""
+    qids, years = year_vectors(dates, kinds=('earliest',))['earliest']
+    usable = (years > -10000) & (years < 10000)
+    # only the nodes' years, to avoid exceeding Node memory limits
+    node_ints = np.array([edges.entity_to_int(node) for node in nodes
+                          if edges.is_encodable(node)], dtype='<i8')
+    usable &= np.isin(qids, node_ints)
+    return qids[usable], years[usable]
 
 
 def write_statements(statements, path):
     """write file containing list of statements/relationships"""
     with open(path, 'w') as csvfile:
-        for item in statements:
+        for item in edges_to_strings(statements):
             csvfile.write("%s\n" % item)
 
 
@@ -174,25 +51,31 @@ def write_items_json(items, path):
         itemsfile.write(json.dumps(items, indent=True))
 
 
-def translate_statements(statements, labels):
-    """translate statements to natural language with labels"""
+def translate_statements(statements, label_store):
+    """translate statements to natural language with labels, looking up only
+    the labels of the entities involved"""
     statements_en = []
-    for statement in statements:
-        splitup = statement.split()
-        new_statement = []
-        for item in splitup:
-            try:
-                new_statement.append(labels[item])
-            except Exception:
-                print("*** Exception: no label for", item)
-                new_statement.append(item)
-        statements_en.append(' '.join(new_statement))
-
-
-def write_arangodb_nodes(nodes, labels, dates):
+    for start in range(0, len(statements), label_batch_size):
+        batch = list(edges_to_strings(
+            statements[start:start + label_batch_size]))
+        labels = label_store.get_many(
+            {item for statement in batch for item in statement.split()})
+        for statement in batch:
+            new_statement = []
+            for item in statement.split():
+                if item in labels:
+                    new_statement.append(labels[item])
+                else:
+                    print("*** Exception: no label for", item)
+                    new_statement.append(item)
+            statements_en.append(' '.join(new_statement))
+    return statements_en
+
+
+def write_arangodb_nodes(nodes, labels, dates, path='nodes.tsv'):
     """write nodes to file for import to ArangoDB"""
     item_header = '_key\tname\tlabel\tdate\n'
-    with open('nodes.tsv', 'w') as nodesfile:
+    with open(path, 'w') as nodesfile:
         nodesfile.write(item_header)
         for node in nodes:
             label = labels[node] if node in labels else node
@@ -202,113 +85,16 @@ def write_arangodb_nodes(nodes, labels, dates):
             nodesfile.write(line)
 
 
-def write_arangodb_rels(statements, labels):
+def write_arangodb_rels(statements, labels, path='relationships.tsv'):
     """write relationships to file for import to ArangoDB"""
     rel_header = '_from\t_to\ttype\n'
-    with open('relationships.tsv', 'w') as relsfile:
+    with open(path, 'w') as relsfile:
         relsfile.write(rel_header)
-        for statement in statements:
-            splitup = statement.split()
-            relsfile.write("%s\t%s\t%s\n" % (splitup[0], splitup[2],
-                                             splitup[1]))
-
-
-def make_nx_graph(statements, labels, years=None):
-    # TODO: test this, or maybe get rid of it if not needed
-    g = nx.MultiDiGraph()
-    for line in statements:
-        try:
-            splitup = line.strip().split()
-            if splitup[0] in labels:
-                source = labels[splitup[0]]
-            else:
-                source = splitup[0]
-            if splitup[2] in labels:
-                destination = labels[splitup[2]]
-            else:
-                destination = splitup[2]
-            if years is not None:
-                if splitup[0] in years:
-                    g.add_node(source, year=years[splitup[0]])
-                if splitup[2] in years:
-                    g.add_node(destination, year=years[splitup[2]])
-            g.add_edge(source, destination, type=splitup[1])
-        except Exception:
-            print("error on line:", line)
-    return g
-
-
-def make_qid_nx_graph(statements, years=None):
-    g = nx.MultiDiGraph()
-    for line in statements:
-        try:
-            splitup = line.strip().split()
-            source = splitup[0]
-            destination = splitup[2]
-            if years is not None:
-                if splitup[0] in years:
-                    g.add_node(source, year=years[splitup[0]])
-                if splitup[2] in years:
-                    g.add_node(destination, year=years[splitup[2]])
-            g.add_edge(source, destination, type=splitup[1])
-        except Exception:
-            print("error on line:", line)
-    return g
-
-
-def graph_report(nxgraph):
-    """report graph statistics, violations of rules/constraints, etc."""
-    def edge_type(e):
-        edge_data = nxgraph.get_edge_data(*e)
-        return edge_data.get(0, {}).get('type', None)
-
-    report = {}
-    report['node_count'] = nxgraph.number_of_nodes()
-    report['edge_count'] = nxgraph.number_of_edges()
-    report['rel_stats'] = Counter([edge_type(e) for e in nxgraph.edges()])
-    report['selfloops'] = list(nxgraph.nodes_with_selfloops())
-    # TODO parents born after "children", or maybe died before (although...)
-    # TODO people "influenced by" others who weren't alive yet (at most, people
-    # would be influenced by the idea of such a person existing)
-    # - might need death dates for this one
-    # TODO identical reciprocal relationships that can't happen (or maybe are
-    #  unlikely and/or indicate a likely misuse of a property)
-    # TODO check other constraints of the various cg_rels
-    return report
-
-
-def direct(statement):
-    """ensure that a statement is pointing in the right direction, for purposes
-    of labeling and checking based on in-degree and out-degree"""
-    splitup = statement.split()
-    if splitup[1] in combined_inverses:
-        return (splitup[2] + ' ' + combined_inverses[splitup[1]] + ' ' +
-                splitup[0])
-    else:
-        return statement
-
-
-def dedupe_and_direct(statements):
-    """create a set of unique statements oriented in the same direction"""
-    print('starting dedupe_and_direct with', len(statements), 'statements')
-    result = {direct(s) for s in statements}
-    print('finishing dedupe_and_direct with', len(result), 'statements')
-    return result
-
-
-def specific_only(statements, years):
-    """return the subset of statements for which at least one end of a causal
-    statement has a time specified"""
-
-    def is_specific(statement):
-        splitup = statement.split()
-        likely = splitup[1] in likely_nonspecific
-        if likely and splitup[0] not in years and splitup[2] not in years:
-            return False
-        else:
-            return True
-
-    return {statement for statement in statements if is_specific(statement)}
+        for src, code, dst in zip(statements['src'].tolist(),
+                                  statements['prop'].tolist(),
+                                  statements['dst'].tolist()):
+            relsfile.write("%s\t%s\t%s\n" % (int_to_entity(src),
+                                             int_to_entity(dst), props[code]))
 
 
 def load_item_filter(path):
@@ -319,31 +105,178 @@ def load_item_filter(path):
     return item_filter
 
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        dump_path = sys.argv[1]
+def rebuild_filter(scan, path):
+    """build the fiction filter from the P279 edges collected by a scan run
+    without one, apply it to the scan, and save it"""
+    filter_set = fiction_closure(scan.subclass_edges)
+    print(len(filter_set), "items in the new filter.")
+    scan.apply_fiction_filter(frozenset(filter_set))
+    # if labels were spilled, the filter's are wanted as well as the graph's
+    scan.resolve_labels(scan.nodes | filter_set)
+    write_filter({item: scan.labels.get(item, item) for item in filter_set},
+                 path)
+
+
+def write_outputs(scan, artifacts_dir=default_dir, metrics=None,
+                  arangodb=None):
+    """derive years, final statements etc. from the scan results and write
+    all of the output files, timing each step with `metrics`; with an
+    arangodb.ArangoLoader, the graph is loaded into ArangoDB instead of
+    being written out as TSVs for arangoimp"""
+    metrics = metrics or RunMetrics()
+    with metrics.stage('resolve_labels'):
+        scan.resolve_labels(scan.nodes)
+    nodes, dates, labels, statements = (
+        scan.nodes, scan.dates.to_array(), scan.labels,
+        scan.statements.to_array())
+    with metrics.stage('node_years'):
+        year_table = node_years(dates, nodes)
+    with metrics.stage('dedupe_and_direct'):
+        unique_statements = edges.dedupe_and_direct(statements)
+    with metrics.stage('specific_only'):
+        statements_final = edges.specific_only(unique_statements, year_table)
+
+    with metrics.stage('write_statements'):
+        # write_statements(statements, 'statements.txt')
+        # write_statements(unique_statements, 'unique_statements.txt')
+        write_statements(statements_final, 'statements_final.txt')
+    with metrics.stage('write_artifacts'):
+        # labels and date claims are only written as binary artifacts; use
+        # artifacts.py to export them as JSON if needed
+        write_artifacts(artifacts_dir, statements_final, year_table, labels,
+                        dates)
+    with metrics.stage('export_graph'):
+        # the layout step reads its graph (and the node years) from these
+        export_graph(statements_final, year_table)
+
+    node_dates = dict(zip(map(int_to_entity, year_table[0].tolist()),
+                          year_table[1].tolist()))
+    if arangodb is None:
+        with metrics.stage('write_arangodb'):
+            write_arangodb_nodes(nodes, labels, node_dates)
+            write_arangodb_rels(statements_final, labels)
     else:
-        dump_path = 'latest-all.json'
-
-    fic_filter = load_item_filter('filter.json')
-    nodes, date_claims, labels, statements = process_dump(dump_path, fic_filter)
-    years = dates_to_years(date_claims)
-    # now filter years to avoid exceeding Node memory limits
-    years_compact = {qid: years[qid] for qid in nodes if qid in years}
-    unique_statements = dedupe_and_direct(statements)
-    statements_final = specific_only(unique_statements, years)
-
-    # write_statements(statements, 'statements.txt')
-    # write_statements(unique_statements, 'unique_statements.txt')
-    write_statements(statements_final, 'statements_final.txt')
-    write_items_json(labels, 'wd_labels.json')
-    write_items_json(date_claims, 'date_claims.json')
-    write_items_json(years_compact, 'wd_years.json')
+        with metrics.stage('load_arangodb'):
+            loaded = load_graph(arangodb, nodes, labels, node_dates,
+                                statements_final)
+        print('ArangoDB:', loaded)
+        metrics.count('arangodb', loaded)
+
+    with metrics.stage('graph_report'):
+        report = graph_report(statements_final, year_table)
+        write_report(report, 'graph_report.json')
+    pprint.pprint(summarise(report))
+    with metrics.stage('validation'):
+        checks = validation.validate(statements_final, year_table, dates)
+        write_report(checks, 'validation_report.json')
+    print('validation:', checks['back_edges']['counts'],
+          checks['monthday_dates']['count'], 'month/day dates')
+
+    metrics.count('entities', scan.entities)
+    metrics.count('nodes', len(nodes))
+    metrics.count('labels', len(labels))
+    metrics.count('statements', len(statements))
+    metrics.count('unique_statements', len(unique_statements))
+    metrics.count('final_statements', len(statements_final))
+    metrics.count('dated_nodes', len(year_table[0]))
+    metrics.count('date_claims', len(dates))
+    metrics.count('statements_by_property',
+                  prop_counts(statements_final['prop'], props))
+    metrics.count('date_claims_by_property',
+                  prop_counts(dates['prop'], date_props))
 
-    write_arangodb_nodes(nodes, labels, years_compact)
-    write_arangodb_rels(statements_final, labels)
 
-    nxgraph = make_qid_nx_graph(statements_final, years=years)
-    graph_report = graph_report(nxgraph)
-    pprint.pprint(graph_report)
-    write_dot(nxgraph, 'nxcg.dot')
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('dump_path', nargs='?', default='latest-all.json')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes to scan the dump with')
+    parser.add_argument('--rebuild-filter', action='store_true',
+                        help='rebuild filter.json from this dump in the same '
+                             'pass, instead of using the existing one')
+    parser.add_argument('--decoder', default='auto',
+                        choices=('auto',) + BACKENDS,
+                        help='JSON backend to decode the dump with')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='skip, without decoding, entities that have no '
+                             'claim or label of interest (nearly every '
+                             'entity in a real dump has a label, so this '
+                             "can't skip anything there and only slows the "
+                             'scan down)')
+    parser.add_argument('--labels', choices=('all', 'graph'), default='all',
+                        help="keep every entity's label, or spill them to "
+                             "disk during the scan and keep only those of "
+                             "the graph's nodes (and the filter's classes)")
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help="record the scan's progress here, and resume "
+                             "from it if an earlier scan of the same dump "
+                             "was cut short")
+    parser.add_argument('--checkpoint-interval', type=int, default=300,
+                        metavar='SECONDS',
+                        help='how often to force the checkpoint to disk')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='run under cProfile, saving the stats here')
+    parser.add_argument('--tracemalloc', type=int, default=0, metavar='N',
+                        help='trace allocations, and list the N biggest '
+                             'places they were made in the run summary')
+    parser.add_argument('--summary', default='run_summary.json',
+                        help='where to write the run summary')
+    parser.add_argument('--arangodb', nargs='?', const=default_url,
+                        metavar='URL',
+                        help='load the graph into ArangoDB at this URL '
+                             '(default %(const)s) instead of writing TSVs; '
+                             'the password, if any, is taken from '
+                             '$ARANGODB_PASSWORD')
+    parser.add_argument('--arangodb-database', default='_system')
+    parser.add_argument('--arangodb-user', default='root')
+    parser.add_argument('--arangodb-workers', type=int, default=4,
+                        help='imports to run at once')
+    parser.add_argument('--arangodb-batch', type=int, default=10000,
+                        help='documents per import request')
+    parser.add_argument('--arangodb-manifest', metavar='DIR',
+                        help='only send what changed since the load '
+                             'recorded here, and remove what has gone')
+    args = parser.parse_args()
+    metrics = RunMetrics(args.profile, args.tracemalloc)
+    arangodb = None
+    if args.arangodb:
+        arangodb = ArangoLoader(
+            args.arangodb, args.arangodb_database, args.arangodb_user,
+            os.environ.get('ARANGODB_PASSWORD', ''), args.arangodb_workers,
+            args.arangodb_batch, args.arangodb_manifest)
+
+    spill_dir = None
+    if args.labels == 'graph':
+        if args.checkpoint:
+            # the spilled labels have to outlive a crash along with the
+            # checkpoint
+            spill_dir = args.checkpoint + '-labels'
+            os.makedirs(spill_dir, exist_ok=True)
+        else:
+            spill_dir = tempfile.mkdtemp(prefix='label-spill-', dir='.')
+    options = {'workers': args.workers, 'decoder': args.decoder,
+               'prefilter': args.prefilter, 'spill_dir': spill_dir,
+               'checkpoint_path': args.checkpoint,
+               'checkpoint_interval': args.checkpoint_interval,
+               'progress': metrics.scan_progress()}
+
+    try:
+        if args.rebuild_filter:
+            with metrics.stage('scan'):
+                scan = process_dump(args.dump_path, **options)
+            with metrics.stage('rebuild_filter'):
+                rebuild_filter(scan, 'filter.json')
+        else:
+            fic_filter = load_item_filter('filter.json')
+            with metrics.stage('scan'):
+                scan = process_dump(args.dump_path, fic_filter, **options)
+        write_outputs(scan, metrics=metrics, arangodb=arangodb)
+    finally:
+        if spill_dir is not None and not args.checkpoint:
+            shutil.rmtree(spill_dir)
+    # the run is done, so there's nothing left to resume
+    if args.checkpoint:
+        os.remove(args.checkpoint)
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir)
+    metrics.write(args.summary)
@@ -0,0 +1,492 @@
+"""single-pass extraction of CauseGraph and fiction filter data from the
+wikidata JSON dump"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from dates import DateBuffer
+from decoders import get_decoder, make_prefilter, scan_props
+from dump_reader import (bounded_imap, is_compressed, open_dump, read_chunks,
+                         read_range, shard_ranges, skip_to, with_end_offsets)
+from edges import EdgeBuffer, entity_to_int, int_to_entity, is_encodable
+from wd_constants import all_times, cg_rels, lang_order, times_plus_nested
+
+subclass = 'P279'
+instance = 'P31'
+
+
+def get_label(obj):
+    """get appropriate label, using language fallback chain"""
+    has_sitelinks = 'sitelinks' in obj
+    for lang in lang_order:
+        site = lang + 'wiki'
+        if has_sitelinks and site in obj['sitelinks']:
+            return obj['sitelinks'][site]['title']
+        elif lang in obj['labels']:
+            return obj['labels'][lang]['value']
+    return None
+
+
+def get_targets(claim_set):
+    """get the item IDs a set of claims points to"""
+    targets = []
+    for spec in claim_set:
+        if 'id' in spec['mainsnak'].get('datavalue', {}).get('value', {}):
+            targets.append(spec['mainsnak']['datavalue']['value']['id'])
+    return targets
+
+
+def get_item_rels(subj_id, rel, claims):
+    class_inst_stmts = []
+    if rel in claims:
+        for obj_id in get_targets(claims[rel]):
+            class_inst_stmts.append((subj_id, rel, obj_id))
+    return class_inst_stmts
+
+
+def class_targets(claims):
+    """get the P31 targets (None if there's no P31 claim) and P279 targets
+    that decide whether an item is fictional"""
+    if instance in claims:
+        return get_targets(claims[instance]), []
+    return None, get_targets(claims.get(subclass, []))
+
+
+def is_real_targets(qid, instance_of, subclass_of, fiction_filter):
+    """check an item's class targets against the fiction filter"""
+    if instance_of is not None:
+        for thing in instance_of:
+            if thing in fiction_filter:
+                return False
+    else:
+        for thing in subclass_of:
+            if thing in fiction_filter and qid not in fiction_filter:
+                print("new fictional class:", qid)
+                return False
+
+    # we don't actually know it's real, but it isn't labeled as fictional
+    return True
+
+
+def is_real(qid, claims, fiction_filter):
+    """check for claims that an item is fictional"""
+    instance_of, subclass_of = class_targets(claims)
+    return is_real_targets(qid, instance_of, subclass_of, fiction_filter)
+
+
+# what the scan does with a claim, by property: take the statements it
+# makes, take its dates, and/or look for dates in its qualifiers
+edge_claim = 1
+date_claim = 2
+nested_date_claim = 4
+
+
+def build_claim_handlers():
+    """{property: bitmask of what to do with its claims}, for every
+    property the scan is interested in"""
+    handlers = {}
+    for props, handler in ((cg_rels, edge_claim), (all_times, date_claim),
+                           (times_plus_nested, nested_date_claim)):
+        for prop in props:
+            handlers[prop] = handlers.get(prop, 0) | handler
+    return handlers
+
+
+claim_handlers = build_claim_handlers()
+
+
+def scan_claims(qid, claims, statements, dates):
+    """visit each claim of an item once, adding the statements it makes to
+    an EdgeBuffer and its dates (main ones first, then those in qualifiers)
+    to a DateBuffer
+
+    Returns whether the item has any CauseGraph claims and the IDs of the
+    other ends of its statements."""
+    cg_subject = False
+    other_qids = []
+    nested_dates = []
+    for claim, claim_set in claims.items():
+        handlers = claim_handlers.get(claim)
+        if handlers is None:
+            continue
+        is_edge = handlers & edge_claim
+        is_date = handlers & date_claim
+        targets = []
+        for spec in claim_set:
+            if is_edge or is_date:
+                value = spec['mainsnak'].get('datavalue', {}).get('value', {})
+                if is_edge and 'id' in value:
+                    targets.append(value['id'])
+                if is_date and 'time' in value:
+                    dates.add(qid, claim, value)
+            if handlers & nested_date_claim and 'qualifiers' in spec:
+                qualifiers = spec['qualifiers']
+                for qualifier in qualifiers:
+                    if qualifier in all_times:
+                        for item in qualifiers[qualifier]:
+                            value = item.get('datavalue', {}).get('value', {})
+                            if 'time' in value:
+                                nested_dates.append(
+                                    (claim + ' ' + qualifier, value))
+        if is_edge:
+            cg_subject = True
+            targets = [target for target in targets if is_encodable(target)]
+            statements.add(qid, claim, targets)
+            other_qids += targets
+    for prop, value in nested_dates:
+        dates.add(qid, prop, value)
+    return cg_subject, other_qids
+
+
+class LabelSpill:
+    """write-only stand-in for the labels dict, which writes every label to
+    a file instead of keeping it, for ScanResult.resolve_labels() to pick
+    out the ones that turn out to be needed"""
+
+    def __init__(self, path):
+        self.path = path
+        self.spillfile = open(path, 'w')
+
+    def __contains__(self, qid):
+        return False
+
+    def __setitem__(self, qid, label):
+        self.spillfile.write(qid + '\t' + json.dumps(label) + '\n')
+
+    def close(self):
+        """close the file, making sure it's on disk (directory entry and
+        all) before a checkpoint can record it"""
+        self.spillfile.flush()
+        os.fsync(self.spillfile.fileno())
+        self.spillfile.close()
+        directory = os.open(os.path.dirname(self.path) or '.', os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+class ScanResult:
+    """everything collected from (part of) the dump
+
+    When the scan runs without a fiction filter, the P279 edges needed to
+    build one are collected, along with the class targets of every item
+    that contributed statements or dates, so that the filter can be applied
+    once the whole dump has been seen."""
+
+    def __init__(self):
+        self.nodes = set()
+        self.dates = DateBuffer()
+        self.labels = {}
+        self.statements = EdgeBuffer()
+        self.subclass_edges = []
+        self.class_claims = {}
+        self.cg_subjects = set()
+        self.label_spills = []
+        self.entities = 0
+
+    def merge(self, other):
+        """add the results of the next part of the dump"""
+        self.entities += other.entities
+        self.nodes.update(other.nodes)
+        self.dates.extend(other.dates)
+        for qid in other.labels:
+            if qid not in self.labels:
+                self.labels[qid] = other.labels[qid]
+        self.statements.extend(other.statements)
+        self.subclass_edges += other.subclass_edges
+        self.class_claims.update(other.class_claims)
+        self.cg_subjects.update(other.cg_subjects)
+        self.label_spills += other.label_spills
+
+    def apply_fiction_filter(self, fiction_filter):
+        """drop everything that came from fictional items, as though the
+        filter had been used during the scan"""
+        fictional = set()
+        for qid, (instance_of, subclass_of) in self.class_claims.items():
+            if not is_real_targets(qid, instance_of, subclass_of,
+                                   fiction_filter):
+                fictional.add(qid)
+
+        fictional_ints = np.array([entity_to_int(qid) for qid in fictional],
+                                  dtype='<i8')
+        dates = self.dates.to_array()
+        self.dates = DateBuffer.from_array(
+            dates[~np.isin(dates['qid'], fictional_ints)])
+        edges = self.statements.to_array()
+        edges = edges[~np.isin(edges['src'], fictional_ints)]
+        self.statements = EdgeBuffer.from_array(edges)
+        self.nodes = self.cg_subjects - fictional
+        self.nodes.update(map(int_to_entity, np.unique(edges['dst']).tolist()))
+        self.class_claims = {}
+
+    def resolve_labels(self, needed):
+        """read back spilled labels, keeping only those of `needed` QIDs
+        (the spill files are left for whoever made the spill directory to
+        delete, so that a checkpointed scan can still be resumed)"""
+        for path in self.label_spills:
+            with open(path) as spillfile:
+                for line in spillfile:
+                    qid, label = line.split('\t', 1)
+                    if qid in needed and qid not in self.labels:
+                        self.labels[qid] = json.loads(label)
+        self.label_spills = []
+
+
+def scan_lines(lines, fiction_filter=None, loads=json.loads, keep=None,
+               spill_dir=None, part=0):
+    """collect statements of interest from an iterable of dump lines
+
+    `loads` decodes a line, and lines for which `keep` (if given) returns
+    False are skipped without being decoded.  With a `spill_dir`, labels
+    are written to a file there (named after `part`) rather than kept."""
+    result = ScanResult()
+    labels = result.labels
+    if spill_dir is not None:
+        labels = LabelSpill(os.path.join(spill_dir, 'labels-%08d.tsv' % part))
+        result.label_spills.append(labels.path)
+
+    for line in lines:
+        if line.strip() in (b'[', b']'):
+            continue
+        if keep is not None and not keep(line):
+            continue
+        try:
+            obj = loads(line.rstrip(b',\n'))
+            result.entities += 1
+            qid = obj['id']
+
+            if qid not in labels:
+                obj_label = get_label(obj)
+                if obj_label is not None:
+                    labels[qid] = obj_label
+
+            if obj['type'] != 'item' or 'claims' not in obj:
+                continue
+            claims = obj['claims']
+            if fiction_filter is None:
+                result.subclass_edges += get_item_rels(qid, subclass, claims)
+            elif not is_real(qid, claims, fiction_filter):
+                continue
+
+            collected = len(result.statements), len(result.dates)
+            cg_subject, other_qids = scan_claims(qid, claims,
+                                                 result.statements,
+                                                 result.dates)
+            if cg_subject:
+                result.cg_subjects.add(qid)
+            if fiction_filter is None and (
+                    cg_subject or
+                    collected != (len(result.statements), len(result.dates))):
+                # only items that brought something need their classes to
+                # be checked against the filter later
+                instance_of, subclass_of = class_targets(claims)
+                if instance_of or subclass_of:
+                    # most items share a handful of classes
+                    result.class_claims[qid] = (
+                        instance_of and tuple(map(sys.intern, instance_of)),
+                        tuple(map(sys.intern, subclass_of)))
+            if fiction_filter is not None:
+                result.nodes.update(other_qids)
+        except Exception as e:
+            print("*** Exception",
+                  type(e), "-", e, "on following line:")
+            print(line)
+
+    result.dates.flush()
+    if spill_dir is not None:
+        labels.close()
+    if fiction_filter is not None:
+        result.nodes.update(result.cg_subjects)
+        result.cg_subjects = set()
+    return result
+
+
+def scan_options(fiction_filter, decoder, prefilter, spill_dir):
+    """the keyword arguments to scan_lines for the given options"""
+    keep = None
+    if prefilter:
+        keep = make_prefilter(scan_props(fiction_filter is None))
+    return {'fiction_filter': fiction_filter,
+            'loads': get_decoder(decoder),
+            'keep': keep,
+            'spill_dir': spill_dir}
+
+
+# the scan options are set up in each worker once, rather than sent with
+# every task
+worker_options = None
+
+
+def init_worker(fiction_filter, decoder, prefilter, spill_dir):
+    global worker_options
+    worker_options = scan_options(fiction_filter, decoder, prefilter,
+                                  spill_dir)
+
+
+def scan_shard(shard):
+    """scan one line-aligned byte range of the dump (run in a worker)"""
+    part, dump_path, start, end = shard
+    return end, scan_lines(read_range(dump_path, start, end), part=part,
+                           **worker_options)
+
+
+def scan_chunk(task):
+    """scan a block of decompressed dump lines (run in a worker)"""
+    part, end, chunk = task
+    return end, scan_lines(chunk.splitlines(True), part=part,
+                           **worker_options)
+
+
+class ScanCheckpoint:
+    """an append-only record of a scan's progress, for picking it up again
+    after a crash
+
+    The file starts with what identifies the scan (the dump and the options
+    that change what's collected), followed by an (end offset, parts done,
+    ScanResult) record for each part of the dump as it's finished.  Records
+    are only forced to disk every `interval` seconds, and a record cut short
+    by a crash is dropped on resuming, so at worst the parts since the last
+    sync are scanned again."""
+
+    def __init__(self, path, identity, interval=300):
+        self.path = path
+        self.identity = identity
+        self.interval = interval
+        self.outfile = None
+        self.last_sync = time.monotonic()
+
+    def resume(self):
+        """merge the results recorded so far, returning them along with the
+        offset to carry on from and the number of parts done; a checkpoint
+        from a different scan is started afresh"""
+        merged, offset, parts = ScanResult(), 0, 0
+        good = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as infile:
+                try:
+                    if pickle.load(infile) == self.identity:
+                        good = infile.tell()
+                        while True:
+                            offset, parts, result = pickle.load(infile)
+                            merged.merge(result)
+                            good = infile.tell()
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    pass
+        if good:
+            print('resuming the scan at byte', offset, 'after', parts,
+                  'parts')
+            self.outfile = open(self.path, 'r+b')
+            self.outfile.truncate(good)
+            self.outfile.seek(good)
+        else:
+            merged, offset, parts = ScanResult(), 0, 0
+            self.outfile = open(self.path, 'wb')
+            pickle.dump(self.identity, self.outfile)
+        return merged, offset, parts
+
+    def add(self, offset, parts, result):
+        pickle.dump((offset, parts, result), self.outfile,
+                    pickle.HIGHEST_PROTOCOL)
+        if time.monotonic() - self.last_sync >= self.interval:
+            self.sync()
+
+    def sync(self):
+        self.outfile.flush()
+        os.fsync(self.outfile.fileno())
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        self.outfile.close()
+
+
+def filter_digest(fiction_filter):
+    """a hash of the fiction filter's contents, so that a checkpoint is only
+    resumed with the same filter"""
+    if fiction_filter is None:
+        return None
+    return hashlib.sha256('\n'.join(sorted(fiction_filter)).encode()
+                          ).hexdigest()
+
+
+def scan_parts(dump_path, options, workers, start=0, first_part=0):
+    """scan the dump from byte `start`, yielding (end offset, ScanResult)
+    for each part of it, in dump order"""
+    if workers <= 1:
+        kwargs = scan_options(*options)
+        with open_dump(dump_path) as infile:
+            skip_to(infile, start)
+            for part, (end, chunk) in enumerate(
+                    with_end_offsets(read_chunks(infile), start), first_part):
+                yield end, scan_lines(chunk.splitlines(True), part=part,
+                                      **kwargs)
+        return
+
+    with multiprocessing.Pool(workers, init_worker, options) as pool:
+        if is_compressed(dump_path):
+            # a compressed stream can't be split up front, so this process
+            # decompresses it and hands out blocks of lines as it goes
+            with open_dump(dump_path) as infile:
+                skip_to(infile, start)
+                tasks = ((part, end, chunk) for part, (end, chunk) in
+                         enumerate(with_end_offsets(read_chunks(infile),
+                                                    start), first_part))
+                yield from bounded_imap(pool, scan_chunk, tasks, workers * 2)
+            return
+
+        # use more shards than workers so that a slow shard doesn't hold up
+        # the whole pool at the end; imap keeps the results in dump order
+        shards = [(part, dump_path, shard_start, end)
+                  for part, (shard_start, end) in enumerate(
+                      shard_ranges(dump_path, workers * 4, start), first_part)]
+        yield from pool.imap(scan_shard, shards)
+
+
+def process_dump(dump_path, fiction_filter=None, workers=1, decoder='auto',
+                 prefilter=False, spill_dir=None, checkpoint_path=None,
+                 checkpoint_interval=300, progress=None):
+    """scan the dump, which may be compressed, splitting it across `workers`
+    processes if more than one is requested
+
+    Without a fiction filter, the result holds what's needed to build one;
+    call apply_fiction_filter() on it once that's done.  `decoder` names a
+    JSON backend (see decoders.py).  With `prefilter`, lines that can't hold
+    a claim or label of interest are skipped undecoded.  With a `spill_dir`,
+    labels are spilled there; call resolve_labels() on the result with the
+    QIDs whose labels are wanted (the spill files have to survive a crash
+    for a checkpointed scan to be resumed).  With a `checkpoint_path`, the
+    scan's progress is recorded there (see ScanCheckpoint), and a scan of
+    the same dump with the same options carries on from it.  `progress`
+    is called with the number of bytes and entities scanned so far after
+    each part."""
+    options = (fiction_filter, decoder, prefilter, spill_dir)
+    merged, start, parts = ScanResult(), 0, 0
+    checkpoint = None
+    if checkpoint_path is not None:
+        stat = os.stat(dump_path)
+        identity = {'dump': os.path.abspath(dump_path), 'size': stat.st_size,
+                    'mtime': stat.st_mtime_ns,
+                    'filter': filter_digest(fiction_filter),
+                    'prefilter': prefilter, 'spill_dir': spill_dir}
+        checkpoint = ScanCheckpoint(checkpoint_path, identity,
+                                    checkpoint_interval)
+        merged, start, parts = checkpoint.resume()
+
+    for end, result in scan_parts(dump_path, options, workers, start, parts):
+        parts += 1
+        merged.merge(result)
+        if checkpoint is not None:
+            checkpoint.add(end, parts, result)
+        if progress is not None:
+            progress(end, merged.entities)
+    if checkpoint is not None:
+        checkpoint.close()
+    return merged